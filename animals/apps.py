@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AnimalsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'animals'
+
+    def ready(self):
+        # connects the cache invalidation receivers
+        from animals import cache
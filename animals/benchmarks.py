@@ -0,0 +1,57 @@
+"""
+    description: Helpers shared by the benchmark_* management commands
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from core.models import AnimalOnboarding, ShelterUser, assign_animal_ids
+from . import cache
+
+
+def best_of(repeat, run):
+    """
+    the fastest of `repeat` timed calls of `run`, in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+@contextmanager
+def seeded_animals(rows):
+    """
+    makes sure at least `rows` animals exist for the duration of the block; whatever is
+    seeded is rolled back afterwards
+    """
+    try:
+        with transaction.atomic():
+            missing = rows - AnimalOnboarding.objects.count()
+            if missing > 0:
+                user = ShelterUser.objects.first() or ShelterUser.objects.create_user(
+                    'benchmark@shelter.org', name='benchmark', phone_number='0000000000', location='benchmark'
+                )
+                species = [key for key, _ in AnimalOnboarding.SPECIES_CHOICES]
+                animals = [
+                    AnimalOnboarding(
+                        species=species[i % len(species)],
+                        gender='unknown',
+                        breed='Mixed',
+                        age_in_years=i % 15,
+                        weight_in_kgs=i % 40,
+                        registered_by=user,
+                    )
+                    for i in range(missing)
+                ]
+                # bulk_create skips the pre_save signal that normally gives out animal_id
+                assign_animal_ids(animals)
+                AnimalOnboarding.objects.bulk_create(animals)
+            yield
+            transaction.set_rollback(True)
+    finally:
+        # pages cached while the seeded rows existed must not outlive them
+        cache.bump_generation()
@@ -0,0 +1,112 @@
+"""
+    description: Read-through cache for the animal listing. Entries are keyed by the
+                 normalized query parameters under a generation counter; any write to
+                 AnimalOnboarding bumps the generation, which orphans every cached page
+                 at once without scanning keys (orphans simply expire).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import AnimalOnboarding
+from core.signals import animals_bulk_changed
+
+
+GENERATION_KEY = 'animals:generation'
+HITS_KEY = 'animals:cache:hits'
+MISSES_KEY = 'animals:cache:misses'
+
+
+def get_cache():
+    return caches[settings.ANIMAL_CACHE['ALIAS']]
+
+
+def _incr(cache, key, initial=1):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, initial, timeout=None)
+        return cache.get(key, initial)
+
+
+def current_generation(cache=None):
+    cache = cache or get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # seeded from the clock: a generation evicted from the cache must never come
+        # back with a value that older entries are still stored under
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    _incr(get_cache(), GENERATION_KEY, initial=time.time_ns())
+
+
+def invalidate():
+    """
+    bumps the generation once the surrounding transaction commits, so a concurrent
+    reader cannot cache the pre-commit state under the new generation
+    """
+    transaction.on_commit(bump_generation)
+
+
+def request_digest(request):
+    """
+    the same digest for any ordering of the same query parameters
+    """
+    params = sorted((key, sorted(request.query_params.getlist(key))) for key in request.query_params)
+    return hashlib.sha1(repr((request.get_host(), request.path, params)).encode()).hexdigest()
+
+
+def cache_key(namespace, request, generation):
+    return f'animals:{namespace}:{generation}:{request_digest(request)}'
+
+
+def get_or_build(namespace, request, build, counted=True):
+    """
+    returns (data, hit); `build` produces the response payload on a miss. Lookups with
+    counted=False stay out of the hit/miss counters, which describe the page cache
+    """
+    cache = get_cache()
+    key = cache_key(namespace, request, current_generation(cache))
+    data = cache.get(key)
+    if data is not None:
+        if counted:
+            _incr(cache, HITS_KEY)
+        return data, True
+
+    if counted:
+        _incr(cache, MISSES_KEY)
+    data = build()
+    cache.set(key, data, timeout=settings.ANIMAL_CACHE['TIMEOUT'])
+    return data, False
+
+
+def stats():
+    cache = get_cache()
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = values.get(HITS_KEY, 0), values.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / (hits + misses) if hits + misses else None,
+        'generation': current_generation(cache),
+    }
+
+
+@receiver(post_save, sender=AnimalOnboarding)
+@receiver(post_delete, sender=AnimalOnboarding)
+def invalidate_animal_cache(sender, **kwargs):
+    invalidate()
+
+
+@receiver(animals_bulk_changed)
+def invalidate_animal_cache_after_bulk_write(sender, **kwargs):
+    invalidate()
@@ -0,0 +1,69 @@
+import hashlib
+from datetime import datetime
+
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import cache
+
+
+class ConditionalGetMixin:
+    """
+        description: Conditional GET for animal views. The validators come from one
+                     aggregate over the filtered queryset (latest updated_at and row
+                     count, so deletes change the ETag too), and If-None-Match /
+                     If-Modified-Since are answered with a 304 before anything is
+                     serialized. The listing caches its validators under the listing
+                     generation, so a poll that has nothing new costs no queries at all.
+    """
+
+    # reverse relations rendered with every animal, as (model, field pointing at the
+    # animal, column that moves with every write to it). Writes to them do not touch the
+    # animal's own updated_at, so their newest value and row count go into the tag too
+    validator_relations = ()
+
+    def get_validator_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def get_validator_aggregates(self):
+        aggregates = {'last_modified': Max('updated_at'), 'count': Count('id')}
+        for model, animal_field, column in self.validator_relations:
+            # one correlated subquery per relation, all inside the same aggregate query
+            related = model.objects.filter(**{animal_field: OuterRef('pk')}).order_by().values(animal_field)
+            name = model._meta.model_name
+            aggregates[f'{name}_latest'] = Max(Subquery(related.annotate(value=Max(column)).values('value')))
+            aggregates[f'{name}_count'] = Sum(Subquery(related.annotate(value=Count('pk')).values('value')))
+        return aggregates
+
+    def build_validators(self):
+        validators = self.get_validator_queryset().order_by().aggregate(**self.get_validator_aggregates())
+        stamps = [value for value in validators.values() if isinstance(value, datetime)]
+        last_modified = max(stamps) if validators['last_modified'] else None
+        # page, page_size, ordering, ... all shape the payload, so they go into the tag
+        values = ':'.join(str(validators[name]) for name in sorted(validators))
+        tag = hashlib.sha1(f'{cache.request_digest(self.request)}:{values}'.encode()).hexdigest()
+        return f'"{tag}"', int(last_modified.timestamp()) if last_modified else None
+
+    def get_validators(self, namespace=None):
+        """
+        cached under the listing generation when a namespace is given; views rendering
+        rows whose writes do not bump the generation build them on every request
+        """
+        if namespace is None:
+            return self.build_validators()
+        validators, _ = cache.get_or_build(f'{namespace}:validators', self.request, self.build_validators,
+                                           counted=False)
+        return validators
+
+    def not_modified_response(self, etag, last_modified):
+        """
+        a 304 when the client's copy is still current, None otherwise
+        """
+        return get_conditional_response(self.request._request, etag=etag, last_modified=last_modified)
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
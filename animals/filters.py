@@ -0,0 +1,126 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from core.models import AnimalOnboarding
+
+
+TRUE_VALUES = {'true', '1', 'yes'}
+FALSE_VALUES = {'false', '0', 'no'}
+
+
+class AnimalOnboardingFilterBackend(BaseFilterBackend):
+    """
+        description: Server-side filters for the animal listing. Choice fields and
+                     month_of_intake take one value or a comma separated list, booleans
+                     take true/false, and age/weight take inclusive _min/_max bounds.
+                     adoptable=true keeps animals whose latest health record is adoptable.
+                     e.g. ?species=cat&intake_type=stray&month_of_intake=6&micro_chipped=false
+    """
+
+    choice_params = {
+        'species': AnimalOnboarding.SPECIES_CHOICES,
+        'intake_type': AnimalOnboarding.INTAKE_TYPE_CHOICES,
+        'gender': AnimalOnboarding.GENDER_CHOICES,
+    }
+    boolean_params = ('is_mix', 'micro_chipped', 'adoptable')
+    # params filtering on an annotation, and the queryset method adding it
+    annotated_params = {'adoptable': 'with_adoptable'}
+    range_params = {
+        'age': 'age_in_years',
+        'weight': 'weight_in_kgs',
+    }
+
+    def parse_list(self, name, raw, parse):
+        values = []
+        for value in raw.split(','):
+            value = value.strip()
+            try:
+                values.append(parse(value))
+            except ValueError:
+                raise ValidationError({name: [f'"{value}" is not a valid value.']})
+        return values
+
+    def parse_choice(self, name, choices):
+        def parse(value):
+            if value not in {key for key, _ in choices}:
+                raise ValidationError({name: [f'"{value}" is not a valid choice.']})
+            return value
+        return parse
+
+    def parse_month(self, value):
+        month = int(value)
+        if not 1 <= month <= 12:
+            raise ValueError(value)
+        return month
+
+    def parse_boolean(self, name, value):
+        if value.lower() in TRUE_VALUES:
+            return True
+        if value.lower() in FALSE_VALUES:
+            return False
+        raise ValidationError({name: ['Must be true or false.']})
+
+    def parse_number(self, name, value):
+        try:
+            return float(value)
+        except ValueError:
+            raise ValidationError({name: ['A valid number is required.']})
+
+    def add_values(self, filters, field, values):
+        # a single value stays a plain equality
+        if len(values) == 1:
+            filters[field] = values[0]
+        else:
+            filters[f'{field}__in'] = values
+
+    def param_names(self):
+        """
+        every parameter get_filters() reads
+        """
+        return (set(self.choice_params) | {'month_of_intake', 'registered_by'} | set(self.boolean_params)
+                | {f'{name}_{bound}' for name in self.range_params for bound in ('min', 'max')})
+
+    def get_filters(self, params):
+        filters = {}
+        for name, choices in self.choice_params.items():
+            if params.get(name):
+                self.add_values(filters, name, self.parse_list(name, params[name], self.parse_choice(name, choices)))
+        if params.get('month_of_intake'):
+            self.add_values(filters, 'month_of_intake',
+                            self.parse_list('month_of_intake', params['month_of_intake'], self.parse_month))
+        for name in self.boolean_params:
+            if params.get(name):
+                filters[name] = self.parse_boolean(name, params[name])
+        for name, field in self.range_params.items():
+            if params.get(f'{name}_min'):
+                filters[f'{field}__gte'] = self.parse_number(f'{name}_min', params[f'{name}_min'])
+            if params.get(f'{name}_max'):
+                filters[f'{field}__lte'] = self.parse_number(f'{name}_max', params[f'{name}_max'])
+        if params.get('registered_by'):
+            self.add_values(filters, 'registered_by_id', self.parse_list('registered_by', params['registered_by'], int))
+        return filters
+
+    def apply_filters(self, queryset, filters):
+        """
+        `queryset` narrowed by get_filters() output, annotated first where a filter needs it
+        """
+        for name, annotate in self.annotated_params.items():
+            if name in filters:
+                queryset = getattr(queryset, annotate)()
+        return queryset.filter(**filters) if filters else queryset
+
+    def filter_queryset(self, request, queryset, view):
+        return self.apply_filters(queryset, self.get_filters(request.query_params))
+
+
+class AnimalOrderingFilter(OrderingFilter):
+    """
+        description: Whitelisted ?ordering= for the animal listing, with id as a tie-breaker
+                     so pages stay stable
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not {'id', '-id'} & set(ordering):
+            ordering = list(ordering) + ['-id' if ordering[-1].startswith('-') else 'id']
+        return ordering
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from rest_framework.renderers import JSONRenderer
+from animals.benchmarks import best_of, seeded_animals
+from core.renderers import ORJSONRenderer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Command(BaseCommand):
+    help = "Measuring JSON encode time and bytes on the wire for /animal/list/ pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=1000,
+                            help='Rows on the measured page; missing rows are seeded and rolled back afterwards')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Encodes per renderer; the fastest one is reported')
+
+    def handle(self, *args, **options):
+        if options['page_size'] < 1 or options['repeat'] < 1:
+            raise CommandError('--page-size and --repeat must be positive integers')
+
+        with seeded_animals(options['page_size']):
+            client = Client()
+            path = f"/animal/list/?page_size={options['page_size']}"
+            data = client.get(path).json()
+            wire = {
+                encoding: client.get(path, HTTP_ACCEPT_ENCODING=encoding)
+                for encoding in ('identity', 'gzip', 'br')
+            }
+
+        self.stdout.write(f'{"renderer":<16}{"encode ms":>10}{"bytes":>10}')
+        for name, renderer in (('JSONRenderer', JSONRenderer()), ('ORJSONRenderer', ORJSONRenderer())):
+            seconds = best_of(options['repeat'], lambda: renderer.render(data))
+            self.stdout.write(f'{name:<16}{seconds * 1000:>10.2f}{len(renderer.render(data)):>10}')
+
+        self.stdout.write('')
+        self.stdout.write(f'{"Accept-Encoding":<16}{"encoding":>10}{"bytes":>10}')
+        for encoding, response in wire.items():
+            self.stdout.write(
+                f"{encoding:<16}{response.get('Content-Encoding', 'identity'):>10}{len(response.content):>10}"
+            )
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('brotli is not installed; br requests fall back to gzip'))
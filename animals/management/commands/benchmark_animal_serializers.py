@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from animals.benchmarks import best_of, seeded_animals
+from animals.serializers import AnimalOnboardingSerializer, animal_values_serializer
+from core.models import AnimalOnboarding
+
+
+class Command(BaseCommand):
+    help = "Comparing the ModelSerializer and values_list read paths for animal list pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Rows serialized per run; missing rows are seeded and rolled back afterwards')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs per path; the fastest one is reported')
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError('--rows and --repeat must be positive integers')
+
+        with seeded_animals(options['rows']):
+            queryset = AnimalOnboarding.objects.order_by('-created_at', '-id')[:options['rows']]
+
+            model_path = best_of(options['repeat'], lambda: AnimalOnboardingSerializer(queryset, many=True).data)
+            values_path = best_of(
+                options['repeat'],
+                lambda: animal_values_serializer.to_representation(animal_values_serializer.values(queryset)),
+            )
+            if AnimalOnboardingSerializer(queryset, many=True).data != animal_values_serializer.to_representation(
+                    animal_values_serializer.values(queryset)):
+                raise CommandError('the two paths produced different output')
+
+        rows = options['rows']
+        self.stdout.write(f'{"path":<18}{"seconds":>10}{"rows/s":>12}')
+        for name, seconds in (('ModelSerializer', model_path), ('values_list plan', values_path)):
+            self.stdout.write(f'{name:<18}{seconds:>10.4f}{rows / seconds:>12.0f}')
+        self.stdout.write(self.style.SUCCESS(f'SPEEDUP: {model_path / values_path:.1f}x'))
@@ -1,13 +1,545 @@
-from rest_framework import serializers
-from core.models import AnimalOnboarding, AnimalHealth, AnimalDocuments
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework import serializers, relations
+from rest_framework.settings import api_settings
+from core.models import (
+    AnimalOnboarding,
+    AnimalHealth,
+    AnimalDocuments,
+    PreviousOwnerInfo,
+    ShelterAssessment,
+    ShelterUser,
+    assign_animal_ids,
+)
+from core.signals import animals_bulk_changed
+from core.statistics import StatisticsDelta
+from .filters import AnimalOnboardingFilterBackend
 
 class AnimalOnboardingSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = AnimalOnboarding
-        fields = '__all__'
+        # ingestion fingerprints, internal to ingest_shelter_data
+        exclude = ['source_key', 'source_hash']
 
     def validate_age_in_years(self, value):
         if value < 0:
             raise serializers.ValidationError('The age must be greater than 0.')
-        return value
\ No newline at end of file
+        return value
+
+
+class RegisteredBySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ShelterUser
+        fields = ['id', 'name', 'usertype']
+
+
+class AnimalHealthSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = AnimalHealth
+        exclude = ['animal']
+
+
+class PreviousOwnerInfoSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = PreviousOwnerInfo
+        exclude = ['animal']
+
+
+class ShelterAssessmentSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ShelterAssessment
+        exclude = ['animal']
+
+
+class AnimalDocumentsSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = AnimalDocuments
+        exclude = ['animal']
+
+
+class AnimalDetailSerializer(AnimalOnboardingSerializer):
+    """
+        description: One animal with everything recorded about it. Use with_relations() on
+                     the queryset: the user and the current health record are joined and
+                     every nested list is prefetched, so any number of animals costs the
+                     same handful of queries.
+    """
+    registered_by = RegisteredBySerializer(read_only=True)
+    current_health = AnimalHealthSerializer(read_only=True)
+    health_info = AnimalHealthSerializer(many=True, read_only=True)
+    previous_owner_info = PreviousOwnerInfoSerializer(many=True, read_only=True)
+    shelter_assessments = ShelterAssessmentSerializer(many=True, read_only=True)
+    documents = AnimalDocumentsSerializer(many=True, read_only=True, source='animaldocuments_set')
+
+    # nested lists newest first
+    prefetches = {
+        'health_info': AnimalHealth.objects.order_by('-created_at', '-id'),
+        'previous_owner_info': PreviousOwnerInfo.objects.order_by('-created_at', '-id'),
+        'shelter_assessments': ShelterAssessment.objects.order_by('-created_at', '-id'),
+        'documents': AnimalDocuments.objects.order_by('-id'),
+    }
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def with_relations(cls, queryset, fields=None):
+        """
+        joins/prefetches what `fields` (default: all of them) needs, and with a
+        fieldset selects only the columns it needs
+        """
+        declared = cls._declared_fields
+        available = set(cls().fields)
+        fields = set(fields) if fields is not None else available
+        joined = [name for name in ('registered_by', 'current_health') if name in fields]
+        if joined:
+            queryset = queryset.select_related(*joined)
+        queryset = queryset.prefetch_related(*[
+            Prefetch(declared[name].source or name, queryset=related)
+            for name, related in cls.prefetches.items() if name in fields
+        ])
+        if fields == available:
+            return queryset
+
+        # id and created_at stay loaded for prefetching and keyset pagination
+        columns = {'id', 'created_at'} | (fields - set(declared))
+        if 'registered_by' in fields:
+            columns |= {'registered_by', 'registered_by__name', 'registered_by__usertype'}
+        if 'current_health' in fields:
+            columns |= {'current_health'} | {f'current_health__{field.name}' for field in AnimalHealth._meta.concrete_fields}
+        return queryset.only(*columns)
+
+
+def latest_health_records(animal_ids):
+    """
+    {animal id: its most recent AnimalHealth} in one query, through current_health
+    """
+    current = AnimalOnboarding.objects.filter(id__in=animal_ids).values('current_health')
+    return {health.animal_id: health for health in AnimalHealth.objects.filter(id__in=current)}
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+        description: many=True that keeps going past invalid items. validated_data holds
+                     (index, data) for every valid item and item_errors the errors of the
+                     rest, so a batch can be saved partially and still report per item.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            message = self.error_messages['not_a_list'].format(input_type=type(data).__name__)
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]}, code='not_a_list')
+        if not self.allow_empty and not data:
+            message = self.error_messages['empty']
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]}, code='empty')
+        if self.max_length is not None and len(data) > self.max_length:
+            message = self.error_messages['max_length'].format(max_length=self.max_length)
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]}, code='max_length')
+
+        self.item_errors = []
+        valid = []
+        for index, item in enumerate(data):
+            try:
+                valid.append((index, self.run_child_validation(item)))
+            except serializers.ValidationError as exc:
+                self.item_errors.append({'index': index, 'errors': exc.detail})
+        return valid
+
+    def validate(self, attrs):
+        return self.child.validate_batch(attrs)
+
+    def create(self, validated_data):
+        return self.child.bulk_create(validated_data)
+
+    def update(self, instance, validated_data):
+        return self.child.bulk_update(validated_data)
+
+    def save(self):
+        if self.instance is not None:
+            self.instance = self.update(self.instance, self.validated_data)
+        else:
+            self.instance = self.create(self.validated_data)
+        return self.instance
+
+
+class AnimalBulkCreateSerializer(AnimalOnboardingSerializer):
+    """
+        description: One item of a bulk intake. Animals are registered by the requesting
+                     user; an optional nested health record is stored with each animal.
+    """
+    registered_by = serializers.PrimaryKeyRelatedField(read_only=True)
+    health = AnimalHealthSerializer(required=False, write_only=True)
+
+    class Meta(AnimalOnboardingSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+
+    def validate_batch(self, items):
+        return items
+
+    def bulk_create(self, items):
+        """
+        saves every valid item in one transaction: one id reservation, one INSERT for
+        the animals and one for their health records
+        """
+        user = self.context['request'].user
+        animals = []
+        for _, data in items:
+            data = dict(data)
+            data.pop('health', None)
+            animals.append(AnimalOnboarding(registered_by=user, **data))
+        assign_animal_ids(animals)
+
+        healths = [
+            AnimalHealth(animal=animal, **data['health'])
+            for animal, (_, data) in zip(animals, items) if data.get('health')
+        ]
+        delta = StatisticsDelta()
+        for animal in animals:
+            delta.add(AnimalOnboarding, animal)
+        for record in healths:
+            delta.add(AnimalHealth, record)
+
+        with transaction.atomic():
+            AnimalOnboarding.objects.bulk_create(animals)
+            AnimalHealth.objects.bulk_create(healths)
+            if healths:
+                AnimalOnboarding.objects.filter(id__in=[record.animal_id for record in healths]).refresh_current_health()
+            # each new animal has at most this one record, so it is the latest; the
+            # response is rendered from these instances, not re-read
+            for record in healths:
+                record.animal.current_health = record
+            delta.apply()
+            animals_bulk_changed.send(sender=AnimalOnboarding, created=len(animals), updated=0)
+        return animals
+
+
+class AnimalBulkUpdateSerializer(AnimalOnboardingSerializer):
+    """
+        description: One item of a bulk PATCH: the animal's id plus the fields to change.
+                     A nested health object updates the animal's latest health record.
+    """
+    id = serializers.IntegerField()
+    registered_by = serializers.PrimaryKeyRelatedField(read_only=True)
+    health = AnimalHealthSerializer(required=False, write_only=True)
+
+    class Meta(AnimalOnboardingSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+
+    def validate(self, attrs):
+        # PATCH validates with partial=True, which leaves every field optional, the id too
+        if 'id' not in attrs:
+            raise serializers.ValidationError({'id': [self.fields['id'].error_messages['required']]}, code='required')
+        return super().validate(attrs)
+
+    def validate_batch(self, items):
+        """
+        drops items whose animal (or, for health changes, health record) does not exist,
+        with two queries for the whole batch
+        """
+        ids = [data['id'] for _, data in items]
+        self.animals = AnimalOnboarding.objects.in_bulk(ids)
+        self.latest_health = latest_health_records([data['id'] for _, data in items if data.get('health')])
+
+        valid = []
+        seen = set()
+        for index, data in items:
+            if data['id'] not in self.animals:
+                error = {'id': [f'Animal {data["id"]} does not exist.']}
+            elif data['id'] in seen:
+                error = {'id': [f'Animal {data["id"]} appears more than once in this batch.']}
+            elif data.get('health') and data['id'] not in self.latest_health:
+                error = {'health': [f'Animal {data["id"]} has no health record to update.']}
+            else:
+                seen.add(data['id'])
+                valid.append((index, data))
+                continue
+            self.parent.item_errors.append({'index': index, 'errors': error})
+        self.parent.item_errors.sort(key=lambda item: item['index'])
+        return valid
+
+    def bulk_update(self, items):
+        """
+        applies every valid item with one UPDATE per model
+        """
+        now = timezone.now()
+        animals, animal_fields = [], {'updated_at'}
+        healths, health_fields = [], {'updated_at'}
+        delta = StatisticsDelta()
+        for _, data in items:
+            data = dict(data)
+            health = data.pop('health', None)
+            animal = self.animals[data.pop('id')]
+            delta.remove(AnimalOnboarding, animal)
+            for field, value in data.items():
+                setattr(animal, field, value)
+            # bulk_update skips auto_now
+            animal.updated_at = now
+            animal_fields.update(data)
+            animals.append(animal)
+            delta.add(AnimalOnboarding, animal)
+            if health:
+                record = self.latest_health[animal.id]
+                delta.remove(AnimalHealth, record)
+                for field, value in health.items():
+                    setattr(record, field, value)
+                delta.add(AnimalHealth, record)
+                record.updated_at = now
+                health_fields.update(health)
+                healths.append(record)
+
+        with transaction.atomic():
+            AnimalOnboarding.objects.bulk_update(animals, sorted(animal_fields))
+            if healths:
+                AnimalHealth.objects.bulk_update(healths, sorted(health_fields))
+            delta.apply()
+            animals_bulk_changed.send(sender=AnimalOnboarding, created=0, updated=len(animals))
+        return animals
+
+
+CAMPAIGN_FIELDS = ['vaccination_status', 'parasite_control', 'current_medications']
+
+
+class CampaignChangesSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = AnimalHealth
+        fields = CAMPAIGN_FIELDS
+        extra_kwargs = {name: {'required': False} for name in CAMPAIGN_FIELDS}
+
+
+class CampaignEntrySerializer(CampaignChangesSerializer):
+    id = serializers.IntegerField()
+
+    class Meta(CampaignChangesSerializer.Meta):
+        fields = ['id'] + CAMPAIGN_FIELDS
+
+
+class HealthCampaignSerializer(serializers.Serializer):
+    """
+        description: A vaccination / treatment day. "changes" are applied to the latest
+                     health record of every animal picked by "animal_ids" or "filter"
+                     (the listing filters) with a single UPDATE; "per_animal" entries
+                     carry their own values and go through one bulk_update. The
+                     animals' updated_at moves with their records.
+                     e.g. {"filter": {"species": "dog"}, "changes": {"parasite_control": "deworming"}}
+    """
+    animal_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False,
+                                       max_length=10000)
+    filter = serializers.DictField(child=serializers.CharField(), required=False)
+    changes = CampaignChangesSerializer(required=False)
+    per_animal = CampaignEntrySerializer(many=True, required=False, allow_empty=False, max_length=10000)
+
+    def validate(self, attrs):
+        if 'animal_ids' in attrs and 'filter' in attrs:
+            raise serializers.ValidationError('Pass either animal_ids or filter, not both.')
+        if not attrs.get('changes') and not attrs.get('per_animal'):
+            raise serializers.ValidationError('Nothing to change: pass changes and/or per_animal.')
+        if attrs.get('changes') and 'animal_ids' not in attrs and 'filter' not in attrs:
+            raise serializers.ValidationError('changes need animal_ids or a filter to apply to.')
+        if 'filter' in attrs:
+            backend = AnimalOnboardingFilterBackend()
+            # a misspelled key must not widen the update to every animal
+            unknown = sorted(set(attrs['filter']) - backend.param_names())
+            if unknown:
+                raise serializers.ValidationError({'filter': [f'Unknown filter: {", ".join(unknown)}.']})
+            filters = backend.get_filters(attrs['filter'])
+            if not filters:
+                raise serializers.ValidationError({'filter': ['At least one known filter is required.']})
+            attrs['filter'] = filters
+        return attrs
+
+    def get_animals(self):
+        data = self.validated_data
+        if 'animal_ids' in data:
+            return AnimalOnboarding.objects.filter(id__in=data['animal_ids'])
+        return AnimalOnboardingFilterBackend().apply_filters(AnimalOnboarding.objects.all(), data['filter'])
+
+    def apply_changes(self, now):
+        """
+        one UPDATE over the latest health record of every targeted animal, and one
+        moving those animals' updated_at
+        """
+        animals = self.get_animals()
+        if 'animal_ids' in self.validated_data:
+            found = set(animals.values_list('id', flat=True))
+            matched, unmatched = len(found), sorted(set(self.validated_data['animal_ids']) - found)
+        else:
+            matched, unmatched = animals.count(), []
+        # the animals first: the changes can move them out of the filter (?adoptable=)
+        animals.filter(current_health__isnull=False).update(updated_at=now)
+        updated = AnimalHealth.objects.filter(id__in=animals.values('current_health')).update(
+            **self.validated_data['changes'], updated_at=now,
+        )
+        return matched, updated, unmatched
+
+    def apply_per_animal(self, now):
+        entries = self.validated_data['per_animal']
+        ids = {entry['id'] for entry in entries}
+        # one query for the animals and their current records
+        records = {
+            animal.id: animal.current_health
+            for animal in AnimalOnboarding.objects.filter(id__in=ids).select_related('current_health')
+        }
+        # later entries for the same animal win
+        changed, fields = {}, {'updated_at'}
+        for entry in entries:
+            record = records.get(entry['id'])
+            if record is None:
+                continue
+            for field, value in entry.items():
+                if field != 'id':
+                    setattr(record, field, value)
+                    fields.add(field)
+            record.updated_at = now
+            changed[record.id] = record
+        AnimalHealth.objects.bulk_update(changed.values(), sorted(fields))
+        AnimalOnboarding.objects.filter(id__in=[record.animal_id for record in changed.values()]).update(updated_at=now)
+        return len(records), len(changed), sorted(ids - set(records))
+
+    def save(self):
+        """
+        returns, per part of the request, the animals matched, the health records updated
+        and the requested ids that matched no animal (animals without any health record
+        are matched but not updated)
+        """
+        now = timezone.now()
+        result = {}
+        with transaction.atomic():
+            for part, apply in (('changes', self.apply_changes), ('per_animal', self.apply_per_animal)):
+                if self.validated_data.get(part):
+                    matched, updated, unmatched = apply(now)
+                    result[part] = {'matched_animals': matched, 'updated_records': updated, 'unmatched_ids': unmatched}
+            updated = sum(part['updated_records'] for part in result.values())
+            if updated:
+                animals_bulk_changed.send(sender=AnimalOnboarding, created=0, updated=updated)
+        return result
+
+
+# database values these fields already return unchanged from to_representation
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField,
+    serializers.FloatField,
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.ReadOnlyField,
+    relations.PrimaryKeyRelatedField,
+)
+
+
+def requested_fields(params, available):
+    """
+    the fields picked by ?fields= and ?exclude= (comma separated), or None when
+    neither is given
+    """
+    if not params.get('fields') and not params.get('exclude'):
+        return None
+    selected = {}
+    for name in ('fields', 'exclude'):
+        selected[name] = [value.strip() for value in params.get(name, '').split(',') if value.strip()]
+        unknown = [value for value in selected[name] if value not in available]
+        if unknown:
+            raise serializers.ValidationError({name: [f'Unknown field: {", ".join(unknown)}.']})
+    fields = selected['fields'] or list(available)
+    return [name for name in fields if name not in selected['exclude']]
+
+
+class ValuesSerializer:
+    """
+        description: Read-only fast path for a ModelSerializer. The field plan (column,
+                     output key and converter per field) is compiled once from the
+                     serializer's own fields; rows are then fetched with values_list()
+                     and turned into dicts without building model instances or running
+                     every field's to_representation. Output is identical to
+                     serializer_class(instances, many=True).data.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        serializer = serializer_class()
+        model = serializer.Meta.model
+        self.serializer_class = serializer_class
+        self.names = []
+        self.columns = []
+        self.converters = []
+        self.datetimes = []
+        for name, field in serializer.fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            self.names.append(name)
+            self.columns.append(model._meta.get_field(field.source).attname)
+            if self.is_iso_datetime(field):
+                self.datetimes.append(name)
+            elif type(field) not in PASSTHROUGH_FIELDS:
+                self.converters.append((name, field.to_representation))
+
+    def narrow(self, fields):
+        """
+        the plan for a subset of the fields; None keeps all of them
+        """
+        if fields is None:
+            return self
+        return _narrowed_plan(self.serializer_class, frozenset(fields))
+
+    def is_iso_datetime(self, field):
+        return (
+            type(field) is serializers.DateTimeField
+            and getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() == 'iso-8601'
+            and 'timezone' not in field.__dict__
+        )
+
+    def iso_datetime(self):
+        """
+        DateTimeField.to_representation with the current timezone looked up once per
+        page instead of once per value
+        """
+        current = timezone.get_current_timezone() if settings.USE_TZ else None
+
+        def convert(value):
+            if current is not None and timezone.is_aware(value):
+                value = value.astimezone(current)
+            value = value.isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+    def values(self, queryset, extra=()):
+        """
+        the queryset as named rows holding the plan's columns, then any `extra` columns
+        needed by the caller but not output (e.g. the keyset pagination position)
+        """
+        columns = self.columns + [column for column in extra if column not in self.columns]
+        return queryset.values_list(*columns, named=True)
+
+    def to_representation(self, rows):
+        names = self.names
+        converters = self.converters + [(name, self.iso_datetime()) for name in self.datetimes]
+        data = []
+        for row in rows:
+            # zip stops at the last output name, leaving the extra columns out
+            item = dict(zip(names, row))
+            for name, convert in converters:
+                value = item[name]
+                if value is not None:
+                    item[name] = convert(value)
+            data.append(item)
+        return data
+
+
+@lru_cache(maxsize=128)
+def _narrowed_plan(serializer_class, fields):
+    return ValuesSerializer(serializer_class, fields=fields)
+
+
+animal_values_serializer = ValuesSerializer(AnimalOnboardingSerializer)
@@ -1,6 +1,22 @@
 from django.urls import path
-from animals.views import OnboardedAnimalsView
+from animals.views import (
+    OnboardedAnimalsView,
+    ExpandedAnimalsView,
+    AnimalDetailView,
+    AnimalBulkView,
+    HealthCampaignView,
+    AnimalCacheStatsView,
+    AnimalExportView,
+    ShelterStatisticsView,
+)
 
 urlpatterns = [
     path('list/', OnboardedAnimalsView.as_view(), name='onboarded-animals'),
+    path('list/expanded/', ExpandedAnimalsView.as_view(), name='onboarded-animals-expanded'),
+    path('list/cache-stats/', AnimalCacheStatsView.as_view(), name='animal-cache-stats'),
+    path('bulk/', AnimalBulkView.as_view(), name='animal-bulk'),
+    path('health/campaign/', HealthCampaignView.as_view(), name='health-campaign'),
+    path('<int:pk>/', AnimalDetailView.as_view(), name='animal-detail'),
+    path('export/', AnimalExportView.as_view(), name='animal-export'),
+    path('statistics/', ShelterStatisticsView.as_view(), name='shelter-statistics'),
 ]
@@ -1,7 +1,26 @@
+from django.db.models import Max
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework.response import Response
-from .serializers import AnimalOnboardingSerializer
-from core.models import AnimalOnboarding
+from .serializers import (
+    AnimalOnboardingSerializer,
+    AnimalDetailSerializer,
+    AnimalBulkCreateSerializer,
+    AnimalBulkUpdateSerializer,
+    HealthCampaignSerializer,
+    animal_values_serializer,
+    requested_fields,
+)
+from core.export import AnimalExporter, FORMATS
+from core.models import (
+    AnimalDocuments,
+    AnimalHealth,
+    AnimalOnboarding,
+    PreviousOwnerInfo,
+    ShelterAssessment,
+    ShelterStatistic,
+)
+from core.statistics import read_statistics
 from rest_framework import status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
@@ -10,32 +29,241 @@ from rest_framework.views import APIView
 from rest_framework.generics import (
     ListAPIView, 
     ListCreateAPIView,
+    RetrieveAPIView,
     CreateAPIView,
     DestroyAPIView
 )
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from . import cache
+from .conditional import ConditionalGetMixin
+from .filters import AnimalOnboardingFilterBackend, AnimalOrderingFilter, TRUE_VALUES
+from .pagination import StandardResultsSetPagination, KeysetPagination
 
 # Create your views here.
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 100
-    page_size_query_param = 'page_size'
-    max_page_size = 1000
+class SparseFieldsetMixin:
+    """
+        description: ?fields=a,b / ?exclude=c on animal endpoints; the views narrow
+                     both the output and the SQL SELECT to the chosen fields
+    """
+
+    def get_fieldset(self, available):
+        """
+        the fields asked for, None for all of them
+        """
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = requested_fields(self.request.query_params, available)
+        return self._fieldset
+
+
+class NestedAnimalMixin(SparseFieldsetMixin):
+    """
+        description: Animals with their relations nested (AnimalDetailSerializer), loading
+                     only the columns and relations the fieldset keeps
+    """
+    serializer_class = AnimalDetailSerializer
+    validator_relations = (
+        (AnimalHealth, 'animal', 'updated_at'),
+        (PreviousOwnerInfo, 'animal', 'updated_at'),
+        (ShelterAssessment, 'animal', 'updated_at'),
+        # documents are never edited in place: a new upload shows in the newest id
+        (AnimalDocuments, 'animal', 'id'),
+    )
+
+    def get_detail_fieldset(self):
+        return self.get_fieldset(list(AnimalDetailSerializer().fields))
+
+    def get_queryset(self):
+        return AnimalDetailSerializer.with_relations(super().get_queryset(), self.get_detail_fieldset())
+
+    def get_validator_aggregates(self):
+        # the registering user's name and type are nested as well
+        return {**super().get_validator_aggregates(), 'registered_by_latest': Max('registered_by__updated_at')}
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, fields=self.get_detail_fieldset(), **kwargs)
+
+
+class AnimalListMixin:
+    """
+        description: Filtering, ordering and pagination shared by the animal listings
+    """
+    pagination_class = StandardResultsSetPagination
+    # ?pagination=cursor (or any request carrying a cursor) switches to keyset pagination
+    cursor_pagination_class = KeysetPagination
+    queryset = AnimalOnboarding.objects.all()
+    filter_backends = [AnimalOnboardingFilterBackend, AnimalOrderingFilter]
+    ordering_fields = ['created_at', 'age_in_years', 'weight_in_kgs', 'month_of_intake', 'species', 'intake_type']
+    ordering = ['-created_at', '-id']
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or 'cursor' in params:
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
-class OnboardedAnimalsView(ListAPIView):
+    def check_ordering(self, request):
+        if isinstance(self.paginator, KeysetPagination) and 'ordering' in request.query_params:
+            raise ValidationError({'ordering': ['Cursor pagination always orders by created_at, newest first.']})
+
+
+class OnboardedAnimalsView(ConditionalGetMixin, SparseFieldsetMixin, AnimalListMixin, ListAPIView):
 
     # permission_classes = [IsAuthenticated]
     # authentication_classes = [TokenAuthentication]
-    pagination_class = StandardResultsSetPagination
 
     def get(self, request, *args, **kwargs):
-        queryset = AnimalOnboarding.objects.all()
+        self.check_ordering(request)
+
+        etag, last_modified = self.get_validators('list')
+        not_modified = self.not_modified_response(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        data, hit = cache.get_or_build('list', request, self.build_data)
+        response = Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+        return self.set_validators(response, etag, last_modified)
+
+    def build_data(self):
+        # read path: plain rows through the precompiled field plan, no model instances
+        plan = animal_values_serializer.narrow(self.get_fieldset(animal_values_serializer.names))
+        queryset = plan.values(self.filter_queryset(self.get_queryset()), extra=('id', 'created_at'))
         page = self.paginate_queryset(queryset)
         
         if page is not None:
-            serializer = AnimalOnboardingSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(plan.to_representation(page)).data
         
-        serializer = AnimalOnboardingSerializer(queryset, many=True)
-        return Response(serializer.data)
-    
\ No newline at end of file
+        return plan.to_representation(queryset)
+
+
+class ExpandedAnimalsView(NestedAnimalMixin, ConditionalGetMixin, AnimalListMixin, ListAPIView):
+    """
+        description: The animal listing with registered_by, health, owner history,
+                     assessments and documents nested in every row
+    """
+
+    def get(self, request, *args, **kwargs):
+        self.check_ordering(request)
+
+        # not cached: writes to the nested tables do not bump the listing generation
+        etag, last_modified = self.get_validators()
+        not_modified = self.not_modified_response(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return self.set_validators(super().get(request, *args, **kwargs), etag, last_modified)
+
+
+class AnimalDetailView(NestedAnimalMixin, ConditionalGetMixin, RetrieveAPIView):
+    queryset = AnimalOnboarding.objects.all()
+
+    def get_validator_queryset(self):
+        return self.queryset.filter(pk=self.kwargs[self.lookup_field])
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        # no last_modified, no animal: the 404 comes from retrieving it
+        if last_modified is not None:
+            not_modified = self.not_modified_response(etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+        return self.set_validators(super().get(request, *args, **kwargs), etag, last_modified)
+
+
+class AnimalBulkView(APIView):
+    """
+        description: Batch intake. POST a list of animals (each with an optional nested
+                     "health" record) to register them all at once, or PATCH a list of
+                     {"id": ..., <fields>} to update them. Valid items are saved in one
+                     transaction; invalid ones are reported by their index in the batch.
+    """
+    permission_classes = [IsAuthenticated]
+    max_batch_size = 1000
+
+    def post(self, request):
+        serializer = AnimalBulkCreateSerializer(
+            data=request.data, many=True, max_length=self.max_batch_size, context={'request': request},
+        )
+        return self.save(serializer, 'created', status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        serializer = AnimalBulkUpdateSerializer(
+            AnimalOnboarding.objects.all(), data=request.data, many=True, partial=True,
+            max_length=self.max_batch_size, context={'request': request},
+        )
+        return self.save(serializer, 'updated', status.HTTP_200_OK)
+
+    def save(self, serializer, action, success_status):
+        serializer.is_valid(raise_exception=True)
+        if serializer.validated_data:
+            serializer.save()
+        data = serializer.data if serializer.validated_data else []
+        return Response(
+            {action: data, 'errors': serializer.item_errors},
+            status=success_status if data else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class HealthCampaignView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = HealthCampaignSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_200_OK)
+
+
+class ShelterStatisticsView(APIView):
+    """
+        description: Dashboard counts per bucket, read from the ShelterStatistic rollups
+                     rather than grouped over the tables. ?dimension= takes a comma
+                     separated subset, e.g. /animal/statistics/?dimension=species,outcome_type
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        dimensions = None
+        if request.query_params.get('dimension'):
+            dimensions = [name.strip() for name in request.query_params['dimension'].split(',')]
+            unknown = set(dimensions) - {name for name, _ in ShelterStatistic.DIMENSION_CHOICES}
+            if unknown:
+                raise ValidationError({'dimension': [f'Unknown dimension(s): {", ".join(sorted(unknown))}.']})
+        return Response(read_statistics(dimensions), status=status.HTTP_200_OK)
+
+
+class AnimalCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache.stats(), status=status.HTTP_200_OK)
+    
+
+class AnimalExportView(APIView):
+    """
+        description: Streams the whole registry (after the listing filters) as NDJSON or CSV.
+                     ?file_format=ndjson|csv, ?health=true adds the latest health record.
+                     e.g. /animal/export/?file_format=csv&species=dog&health=true
+    """
+    filter_backends = [AnimalOnboardingFilterBackend]
+
+    def get(self, request):
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in FORMATS:
+            raise ValidationError({'file_format': [f'Must be one of: {", ".join(FORMATS)}.']})
+
+        queryset = AnimalOnboarding.objects.all()
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+
+        exporter = AnimalExporter(
+            queryset,
+            file_format=file_format,
+            with_health=request.query_params.get('health', '').lower() in TRUE_VALUES,
+        )
+        response = StreamingHttpResponse(exporter, content_type=exporter.content_type)
+        response['Content-Disposition'] = f'attachment; filename="animals.{file_format}"'
+        return response
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +52,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,6 +81,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'animalshelterproject.wsgi.application'
+ASGI_APPLICATION = 'animalshelterproject.asgi.application'
 
 
 # Database
@@ -94,16 +98,78 @@ DATABASES = {
    }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# per-process memory by default (and in tests); set REDIS_URL to share the cache
+# between workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'animal-shelter',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# read-through cache of the animal listing (animals/cache.py)
+ANIMAL_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
 CORS_ORIGIN_ALLOW_ALL = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',  # Add this line
+        'users.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 100
 }
 
+# token -> user lookups: in-process LRU, plus a shared tier when SHARED_ALIAS names a cache
+TOKEN_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'LOCAL_TTL': 30,
+    'SHARED_ALIAS': 'default' if os.environ.get('REDIS_URL') else None,
+    'SHARED_TTL': 300,
+}
+
+# tokens expire TTL after creation or their last renewal; a token in use is renewed
+# once older than RENEW_AFTER. purge_expired_tokens deletes the expired ones
+TOKEN_EXPIRY = {
+    'TTL': timedelta(days=7),
+    'RENEW_AFTER': timedelta(hours=1),
+    'ROTATE_ON_LOGIN': False,
+}
+
+# login/signup hash passwords on a thread pool of WORKERS threads (None: one per CPU);
+# past MAX_PENDING hashes in flight they answer 503 instead of queueing
+PASSWORD_HASHING = {
+    'WORKERS': None,
+    'MAX_PENDING': 64,
+}
+
+# responses under MIN_LENGTH bytes are sent uncompressed
+API_COMPRESSION = {
+    'MIN_LENGTH': 1024,
+    'BROTLI_QUALITY': 4,
+}
+
 GRAPH_MODELS ={
     'all_applications': True,
     'graph_models': True,
@@ -11,4 +11,5 @@ admin.site.register(ShelterAssessment)
 admin.site.register(PotentialAdopterInfo)
 admin.site.register(HomeInspectionPreAdoption)
 admin.site.register(OutcomePrediction)
-admin.site.register(AwarenessCreation)
\ No newline at end of file
+admin.site.register(AwarenessCreation)
+admin.site.register(IngestionCheckpoint)
\ No newline at end of file
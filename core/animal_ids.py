@@ -0,0 +1,188 @@
+"""
+    description: Collision-free allocator for AnimalOnboarding.animal_id (e.g. DOG-4K9Q2Z)
+
+    Every species prefix owns a counter of blocks of BLOCK_SIZE ids. A process reserves
+    whole blocks (a PostgreSQL sequence, or the AnimalIdSequence table elsewhere) and
+    hands ids out of them from memory, so there is no database round trip per id. Each
+    counter value maps onto the six character code through a fixed permutation of the
+    36^6 code space: codes stay unique without looking sequential. Ids issued by the
+    old random generator may still sit anywhere in that space, so every freshly
+    reserved block is checked against existing rows with one query.
+
+    The AnimalIdSequence counter is updated inside the caller's transaction and goes
+    back with it on rollback, so a block reserved that way is only handed to the
+    reserving connection until it commits, and is dropped if it rolls back.
+"""
+import os
+import re
+import string
+import threading
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import F
+
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+BLOCK_SIZE = 1000
+
+# any multiplier coprime with 36 (neither even nor a multiple of 3) makes
+# value -> (value * MULTIPLIER + OFFSET) % CODE_SPACE a bijection
+MULTIPLIER = 1_453_776_071
+OFFSET = 879_609_302
+
+
+def species_prefix(species):
+    return species[:3].upper()
+
+
+def sequence_name(prefix):
+    return f"core_animal_id_{re.sub('[^A-Z0-9]', '_', prefix).lower()}_seq"
+
+
+# every two character pair, indexed by its base 36 value
+_PAIRS = [first + second for first in ALPHABET for second in ALPHABET]
+_PAIR_SPACE = len(_PAIRS)
+
+
+def encode(value):
+    """
+    counter value -> six character code; distinct values give distinct codes
+    """
+    value = (value * MULTIPLIER + OFFSET) % CODE_SPACE
+    value, low = divmod(value, _PAIR_SPACE)
+    high, middle = divmod(value, _PAIR_SPACE)
+    return _PAIRS[high] + _PAIRS[middle] + _PAIRS[low]
+
+
+def reserve_blocks(prefix, count):
+    """
+    reserves `count` blocks for `prefix` and returns their numbers
+    """
+    if connection.vendor == 'postgresql':
+        # sequences are not transactional: a rolled back caller never gives a block back
+        name = sequence_name(prefix)
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {connection.ops.quote_name(name)}')
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [name, count])
+            return [row[0] for row in cursor.fetchall()]
+
+    AnimalIdSequence = apps.get_model('core', 'AnimalIdSequence')
+    with transaction.atomic():
+        AnimalIdSequence.objects.get_or_create(prefix=prefix)
+        AnimalIdSequence.objects.filter(prefix=prefix).update(next_block=F('next_block') + count)
+        next_block = AnimalIdSequence.objects.values_list('next_block', flat=True).get(prefix=prefix)
+    return list(range(next_block - count, next_block))
+
+
+class Reservation:
+    """
+        description: Ids of a block reserved through the AnimalIdSequence table, which
+                     stay private to the reserving connection until its transaction commits
+    """
+
+    def __init__(self, prefix, animal_ids):
+        self.prefix = prefix
+        self.animal_ids = animal_ids
+        self.connection = connections[DEFAULT_DB_ALIAS]
+        self.committed = False
+        # runs right away in autocommit mode
+        transaction.on_commit(self.commit)
+
+    def commit(self):
+        self.committed = True
+
+    def rolled_back(self):
+        # a rolled back transaction or savepoint discards its on_commit callbacks
+        return not self.committed and all(entry[1] != self.commit for entry in self.connection.run_on_commit)
+
+
+class AnimalIdAllocator:
+    """
+        description: Hands out animal ids from blocks reserved per species prefix;
+                     thread safe, and forked workers never reuse their parent's blocks
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._available = {}
+        self._reservations = []
+
+    def _refill(self, prefix, needed):
+        AnimalOnboarding = apps.get_model('core', 'AnimalOnboarding')
+        blocks = reserve_blocks(prefix, -(-needed // BLOCK_SIZE))
+        for block in blocks:
+            if block * BLOCK_SIZE >= CODE_SPACE:
+                raise OverflowError(f'animal id space for {prefix} is exhausted')
+            animal_ids = [f'{prefix}-{encode(value)}'
+                          for value in range(block * BLOCK_SIZE, (block + 1) * BLOCK_SIZE)]
+            taken = set(
+                AnimalOnboarding.objects.filter(animal_id__in=animal_ids).values_list('animal_id', flat=True)
+            )
+            # popped from the end, so keep the block in reverse order
+            animal_ids = list(reversed([animal_id for animal_id in animal_ids if animal_id not in taken]))
+            if connection.vendor == 'postgresql':
+                self._available.setdefault(prefix, []).extend(animal_ids)
+            else:
+                self._reservations.append(Reservation(prefix, animal_ids))
+
+    def _settle(self):
+        """
+        committed reservations join the shared ids, rolled back ones are dropped
+        """
+        pending = []
+        for reservation in self._reservations:
+            if reservation.committed:
+                self._available.setdefault(reservation.prefix, []).extend(reservation.animal_ids)
+            elif not reservation.rolled_back():
+                pending.append(reservation)
+        self._reservations = pending
+
+    def _take(self, prefix, count):
+        """
+        up to `count` ids: this connection's uncommitted reservations first, then the shared ones
+        """
+        current = connections[DEFAULT_DB_ALIAS]
+        sources = [reservation.animal_ids for reservation in self._reservations
+                   if reservation.prefix == prefix and reservation.connection is current]
+        sources.append(self._available.setdefault(prefix, []))
+        allocated = []
+        for available in sources:
+            picked = available[len(available) - min(count - len(allocated), len(available)):]
+            del available[len(available) - len(picked):]
+            allocated.extend(reversed(picked))
+        return allocated
+
+    def allocate(self, species, count=1):
+        prefix = species_prefix(species)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._available = {}
+                self._reservations = []
+            self._settle()
+            allocated = self._take(prefix, count)
+            while len(allocated) < count:
+                self._refill(prefix, count - len(allocated))
+                allocated.extend(self._take(prefix, count - len(allocated)))
+        return allocated
+
+    def allocate_many(self, species):
+        """
+        one id per entry in `species`, in the same order
+        """
+        positions = {}
+        for position, value in enumerate(species):
+            positions.setdefault(species_prefix(value), []).append(position)
+
+        animal_ids = [None] * len(species)
+        for prefix, prefix_positions in positions.items():
+            for position, animal_id in zip(prefix_positions, self.allocate(prefix, len(prefix_positions))):
+                animal_ids[position] = animal_id
+        return animal_ids
+
+
+allocator = AnimalIdAllocator()
@@ -0,0 +1,8 @@
+"""
+    description: Batched ingestion of intake exports into AnimalOnboarding / AnimalHealth
+"""
+from core.ingestion.backends import OrmBackend, CopyBackend, BACKENDS, get_backend
+from core.ingestion.checkpoints import Fingerprinter, content_hash, load_checkpoint
+from core.ingestion.normalize import RejectWriter, normalize_frame
+from core.ingestion.profiling import IngestionProfiler, NullProfiler
+from core.ingestion.pipeline import IngestionPipeline, ChunkResult
@@ -0,0 +1,240 @@
+import csv
+import io
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.ingestion.profiling import NullProfiler
+from core.models import AnimalOnboarding, AnimalHealth, assign_animal_ids, generate_animal_ids
+from core.statistics import StatisticsDelta
+
+
+ANIMAL_FIELDS = (
+    'breed',
+    'intake_type',
+    'age_in_years',
+    'month_of_intake',
+    'colour',
+    'species',
+    'gender',
+    'is_mix',
+    'source_key',
+    'source_hash',
+)
+
+HEALTH_FIELDS = (
+    'intake_condition',
+    'neutering_status',
+)
+
+
+class OrmBackend:
+    """
+        description: Writes normalized records with bulk_create; works on every database Django supports
+    """
+    name = 'orm'
+
+    def __init__(self, registered_by, batch_size=1000, profiler=None):
+        self.registered_by = registered_by
+        self.batch_size = batch_size
+        self.profiler = profiler or NullProfiler()
+
+    def count_new(self, records):
+        """
+        adds a chunk of new records (an animal and a health record each) to the statistics
+        """
+        with self.profiler.stage('statistics'):
+            delta = StatisticsDelta()
+            for record in records:
+                delta.add(AnimalOnboarding, record)
+                delta.add(AnimalHealth, record)
+            delta.apply()
+
+    def write(self, records):
+        animals = [
+            AnimalOnboarding(registered_by=self.registered_by,
+                             **{field: record[field] for field in ANIMAL_FIELDS})
+            for record in records
+        ]
+
+        with transaction.atomic():
+            # bulk_create skips the pre_save signal, so ids are handed out here
+            with self.profiler.stage('ids'):
+                assign_animal_ids(animals)
+            with self.profiler.stage('write'):
+                AnimalOnboarding.objects.bulk_create(animals, batch_size=self.batch_size)
+                AnimalHealth.objects.bulk_create(
+                    [
+                        AnimalHealth(animal=animal, **{field: record[field] for field in HEALTH_FIELDS})
+                        for record, animal in zip(records, animals)
+                    ],
+                    batch_size=self.batch_size,
+                )
+            with self.profiler.stage('current_health'):
+                AnimalOnboarding.objects.filter(id__in=[animal.id for animal in animals]).refresh_current_health()
+            self.count_new(records)
+        return len(animals)
+
+    def update(self, records, animal_pks):
+        """
+        rewrites changed source rows in place: the animal and the health record it was loaded with
+        """
+        now = timezone.now()
+        with self.profiler.stage('lookup'):
+            animals = AnimalOnboarding.objects.in_bulk(animal_pks)
+            health_records = {}
+            # descending ids, so the earliest record (the one loaded with the animal) wins
+            for health in AnimalHealth.objects.filter(animal_id__in=animal_pks).order_by('-id'):
+                health_records[health.animal_id] = health
+
+        changed_animals, changed_health = [], []
+        delta = StatisticsDelta()
+        for record, pk in zip(records, animal_pks):
+            animal = animals[pk]
+            delta.remove(AnimalOnboarding, animal)
+            delta.add(AnimalOnboarding, record)
+            for field in ANIMAL_FIELDS:
+                setattr(animal, field, record[field])
+            animal.updated_at = now
+            changed_animals.append(animal)
+
+            health = health_records.get(pk)
+            if health is not None:
+                delta.remove(AnimalHealth, health)
+                delta.add(AnimalHealth, record)
+                for field in HEALTH_FIELDS:
+                    setattr(health, field, record[field])
+                health.updated_at = now
+                changed_health.append(health)
+
+        with transaction.atomic(), self.profiler.stage('update'):
+            # bulk_update leaves auto_now fields alone, hence updated_at in the field list
+            AnimalOnboarding.objects.bulk_update(
+                changed_animals, ANIMAL_FIELDS + ('updated_at',), batch_size=self.batch_size
+            )
+            AnimalHealth.objects.bulk_update(
+                changed_health, HEALTH_FIELDS + ('updated_at',), batch_size=self.batch_size
+            )
+            delta.apply()
+        return len(changed_animals)
+
+
+class CopyBackend(OrmBackend):
+    """
+        description: Streams normalized records into a temporary staging table with
+                     COPY FROM STDIN and moves them into core_animalonboarding and
+                     core_animalhealth with two set-based INSERT ... SELECT statements.
+                     Changed rows are updated through the ORM. PostgreSQL only.
+    """
+    name = 'copy'
+    staging_table = 'ingest_staging'
+
+    def staging_columns(self):
+        """
+        (column, db type) pairs of the staging table, typed after the model fields
+        """
+        columns = [('animal_id', AnimalOnboarding._meta.get_field('animal_id').db_type(connection))]
+        columns += [(field, AnimalOnboarding._meta.get_field(field).db_type(connection)) for field in ANIMAL_FIELDS]
+        columns += [(field, AnimalHealth._meta.get_field(field).db_type(connection)) for field in HEALTH_FIELDS]
+        return columns
+
+    def copy_rows(self, cursor, records, animal_ids):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record, animal_id in zip(records, animal_ids):
+            row = [animal_id]
+            row += [record[field] for field in ANIMAL_FIELDS + HEALTH_FIELDS]
+            # csv writes None as an empty unquoted field, which COPY reads as NULL
+            writer.writerow(['t' if value is True else 'f' if value is False else value for value in row])
+        buffer.seek(0)
+
+        columns = ', '.join(connection.ops.quote_name(column) for column, _ in self.staging_columns())
+        sql = f'COPY {self.staging_table} ({columns}) FROM STDIN WITH (FORMAT csv)'
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+    def insert_select(self, cursor, model, staged, extra_sources, join=''):
+        """
+        INSERT INTO <model table> SELECT ... FROM the staging table. Columns come from
+        `staged` (copied as is), `extra_sources` (raw SQL expressions) or the model
+        field default, since Django defaults are not database defaults.
+        """
+        quote = connection.ops.quote_name
+        now = timezone.now()
+        columns, expressions, params = [], [], []
+        for field in model._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            columns.append(quote(field.column))
+            if field.name in extra_sources:
+                expressions.append(extra_sources[field.name])
+            elif field.name in staged:
+                expressions.append(f's.{quote(field.column)}')
+            elif getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                expressions.append('%s')
+                params.append(now)
+            else:
+                expressions.append('%s')
+                params.append(field.get_db_prep_save(field.get_default(), connection))
+
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(columns)}) '
+            f'SELECT {", ".join(expressions)} FROM {self.staging_table} s {join}',
+            params,
+        )
+
+    def write(self, records):
+        quote = connection.ops.quote_name
+        with self.profiler.stage('ids'):
+            animal_ids = generate_animal_ids([record['species'] for record in records])
+
+        with transaction.atomic(), connection.cursor() as cursor, self.profiler.stage('write'):
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {self.staging_table} ('
+                + ', '.join(f'{quote(column)} {db_type}' for column, db_type in self.staging_columns())
+                + ') ON COMMIT DROP'
+            )
+            # COPY goes around the cursor's execute(), so it is only visible as a stage
+            with self.profiler.stage('copy'):
+                self.copy_rows(cursor, records, animal_ids)
+
+            self.insert_select(
+                cursor, AnimalOnboarding,
+                staged=('animal_id',) + ANIMAL_FIELDS,
+                extra_sources={'registered_by': str(int(self.registered_by.pk))},
+            )
+            # the pre-assigned animal_id is unique, so it links every staged health
+            # row to the onboarding row inserted above
+            self.insert_select(
+                cursor, AnimalHealth,
+                staged=HEALTH_FIELDS,
+                extra_sources={'animal': 'ao.id'},
+                join=(f'JOIN {quote(AnimalOnboarding._meta.db_table)} ao '
+                      f'ON ao.{quote("animal_id")} = s.{quote("animal_id")}'),
+            )
+            # ON COMMIT DROP only fires on the outermost commit; drop it right away
+            # so the next chunk can stage again when called inside a wider transaction
+            cursor.execute(f'DROP TABLE {self.staging_table}')
+            with self.profiler.stage('current_health'):
+                AnimalOnboarding.objects.filter(animal_id__in=animal_ids).refresh_current_health()
+            self.count_new(records)
+        return len(records)
+
+
+BACKENDS = {
+    OrmBackend.name: OrmBackend,
+    CopyBackend.name: CopyBackend,
+}
+
+
+def get_backend(name, registered_by, batch_size=1000, profiler=None):
+    """
+    COPY is PostgreSQL specific; every other database falls back to the ORM backend
+    """
+    if name == CopyBackend.name and connection.vendor != 'postgresql':
+        name = OrmBackend.name
+    return BACKENDS[name](registered_by=registered_by, batch_size=batch_size, profiler=profiler)
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from core.models import AnimalOnboarding, AnimalHealth
+
+
+# CSV column -> dtype; only these columns are read from the export. Numbers are read
+# as text and converted by normalize_frame, so one bad cell rejects its row instead of
+# failing the whole read
+SOURCE_DTYPES = {
+    'parent_breed': 'string',
+    'intake_type': 'category',
+    'age_upon_intake_(years)': 'string',
+    'intake_month': 'string',
+    'color_combination': 'string',
+    'animal_type': 'category',
+    'sex_of_animal': 'category',
+    'is_mix': 'category',
+    'intake_condition': 'category',
+    'neutering_status': 'category',
+}
+
+# model field -> values accepted by the model's choices
+ALLOWED_VALUES = {
+    'intake_type': {value for value, _ in AnimalOnboarding.INTAKE_TYPE_CHOICES},
+    'species': {value for value, _ in AnimalOnboarding.SPECIES_CHOICES},
+    'gender': {value for value, _ in AnimalOnboarding.GENDER_CHOICES},
+    'neutering_status': {value for value, _ in AnimalHealth.NEUTERING_STATUS},
+    'intake_condition': {value for value, _ in AnimalHealth.OVERALL_HEALTH_STATUS_CHOICES},
+}
+
+REJECT_REASON = 'reject_reason'
+
+
+def source_columns(key_column=None):
+    return list(SOURCE_DTYPES) + ([key_column] if key_column else [])
+
+
+def source_dtypes(key_column=None):
+    return {**SOURCE_DTYPES, **({key_column: 'string'} if key_column else {})}
+
+
+def _categorical(series, transform):
+    """
+    applies `transform` once per distinct value instead of once per row
+    """
+    series = series.astype('category')
+    mapping = {category: transform(str(category)) for category in series.cat.categories}
+    return series.map(mapping).astype(object)
+
+
+def _optional_text(series):
+    return series.astype(object).where(series.notna(), None)
+
+
+def normalize_frame(df, key_column=None):
+    """
+    column-wise normalization and validation of one chunk of the intake export.
+    returns (clean, rejects): `clean` carries the AnimalOnboarding / AnimalHealth field
+    names, `rejects` the offending source rows with a `reject_reason` column.
+    """
+    clean = pd.DataFrame(index=df.index)
+    clean['breed'] = _optional_text(df['parent_breed'])
+    clean['intake_type'] = _categorical(df['intake_type'], lambda value: value.strip().lower().replace(' ', '_'))
+    # non-numeric cells become NaN and are rejected below
+    clean['age_in_years'] = pd.to_numeric(df['age_upon_intake_(years)'], errors='coerce').astype('float64')
+    clean['month_of_intake'] = pd.to_numeric(df['intake_month'], errors='coerce').astype('float64')
+    clean['colour'] = _optional_text(df['color_combination'])
+    clean['species'] = _categorical(df['animal_type'], lambda value: value.strip().lower())
+    clean['gender'] = _categorical(df['sex_of_animal'], lambda value: value.strip().lower())
+    clean['is_mix'] = df['is_mix'].astype(object).eq('Yes').to_numpy()
+    clean['intake_condition'] = _categorical(df['intake_condition'], lambda value: value.strip().lower())
+    clean['neutering_status'] = _categorical(df['neutering_status'], lambda value: value.strip().lower())
+    if key_column:
+        clean[key_column] = df[key_column]
+
+    reasons = pd.Series('', index=df.index, dtype=object)
+
+    def reject(mask, reason):
+        mask = np.asarray(mask, dtype=bool)
+        reasons[mask] = reasons[mask] + reason + '; '
+
+    for field, allowed in ALLOWED_VALUES.items():
+        values = clean[field]
+        reject(~values.isin(allowed), f'invalid {field}')
+    reject(clean['age_in_years'].isna() | (clean['age_in_years'] < 0), 'invalid age_in_years')
+    months = clean['month_of_intake']
+    reject(months.isna() | (months < 1) | (months > 12) | (months % 1 != 0), 'invalid month_of_intake')
+    if key_column:
+        reject(df[key_column].isna(), f'missing {key_column}')
+
+    rejected = reasons != ''
+    rejects = df[rejected].copy()
+    rejects[REJECT_REASON] = reasons[rejected].str.rstrip('; ')
+
+    clean = clean[~rejected].copy()
+    clean['month_of_intake'] = clean['month_of_intake'].astype('int64')
+    return clean, rejects
+
+
+class RejectWriter:
+    """
+        description: Appends rejected source rows, with their row number and reason, to a CSV file
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.rows = 0
+        if not append and os.path.exists(path):
+            os.remove(path)
+
+    def write(self, rejects):
+        if rejects.empty:
+            return 0
+        rejects.to_csv(
+            self.path,
+            mode='a',
+            header=not os.path.exists(self.path),
+            index=True,
+            index_label='source_row',
+        )
+        self.rows += len(rejects)
+        return len(rejects)
@@ -0,0 +1,128 @@
+from collections import namedtuple
+
+import pandas as pd
+from django.db import transaction
+
+from core.ingestion.backends import get_backend
+from core.ingestion.checkpoints import Fingerprinter, load_checkpoint
+from core.ingestion.normalize import RejectWriter, normalize_frame, source_columns, source_dtypes
+from core.ingestion.profiling import NullProfiler
+from core.models import AnimalOnboarding
+from core.signals import animals_bulk_changed
+
+
+ChunkResult = namedtuple('ChunkResult', ['number', 'rows', 'created', 'updated', 'unchanged', 'rejected', 'total_rows'])
+
+
+class IngestionPipeline:
+    """
+        description: Reads an intake CSV in chunks, normalizes and validates every chunk
+                     column-wise (bad rows go to the reject file), fingerprints it, hands new
+                     rows to a write backend (ORM bulk_create or PostgreSQL COPY) and changed
+                     rows to its update path. Each chunk commits together with
+                     the checkpoint, so re-runs skip unchanged rows and `resume` continues
+                     after the last committed chunk. Pass an IngestionProfiler to time
+                     every stage.
+    """
+
+    def __init__(self, path, registered_by, batch_size=1000, backend='orm', key_column=None, resume=False,
+                 reject_path=None, profiler=None):
+        self.path = path
+        self.reject_path = reject_path or f'{path}.rejects.csv'
+        self.batch_size = batch_size
+        self.key_column = key_column
+        self.resume = resume
+        self.profiler = profiler or NullProfiler()
+        self.backend = get_backend(backend, registered_by=registered_by, batch_size=batch_size,
+                                   profiler=self.profiler)
+        # keyed to the file being read, see run()
+        self.fingerprinter = None
+
+    def read_chunks(self):
+        return pd.read_csv(
+            self.path,
+            chunksize=self.batch_size,
+            usecols=source_columns(self.key_column),
+            dtype=source_dtypes(self.key_column),
+        )
+
+    def normalize_chunk(self, df):
+        with self.profiler.stage('normalize'):
+            clean, rejects = normalize_frame(df, key_column=self.key_column)
+            records = clean.to_dict('records')
+        with self.profiler.stage('fingerprint'):
+            records = self.fingerprinter.stamp(records, clean)
+        return records, clean.index, rejects
+
+    def write_chunk(self, records, checkpoint, rows_read):
+        # a key repeated within the chunk keeps its last version
+        records = list({record['source_key']: record for record in records}.values())
+        with self.profiler.stage('lookup'):
+            existing = {
+                source_key: (source_hash, pk)
+                for source_key, source_hash, pk in AnimalOnboarding.objects.filter(
+                    source_key__in=[record['source_key'] for record in records]
+                ).values_list('source_key', 'source_hash', 'id')
+            }
+        new_records = [record for record in records if record['source_key'] not in existing]
+        changed_records = [
+            record for record in records
+            if record['source_key'] in existing and existing[record['source_key']][0] != record['source_hash']
+        ]
+
+        with transaction.atomic():
+            created = self.backend.write(new_records) if new_records else 0
+            updated = 0
+            if changed_records:
+                updated = self.backend.update(
+                    changed_records, [existing[record['source_key']][1] for record in changed_records]
+                )
+            if created or updated:
+                with self.profiler.stage('signals'):
+                    animals_bulk_changed.send(sender=AnimalOnboarding, created=created, updated=updated)
+            with self.profiler.stage('checkpoint'):
+                checkpoint.rows_committed = rows_read
+                checkpoint.save(update_fields=['rows_committed', 'updated_at'])
+        return created, updated
+
+    def run(self):
+        checkpoint = load_checkpoint(self.path, resume=self.resume)
+        if checkpoint.completed:
+            return
+        self.fingerprinter = Fingerprinter(self.key_column, signature=checkpoint.signature)
+
+        total_rows = 0
+        rejects_file = RejectWriter(self.reject_path, append=self.resume)
+        chunks = iter(self.read_chunks())
+        number = 0
+        while True:
+            self.profiler.begin_chunk()
+            with self.profiler.stage('parse'):
+                df = next(chunks, None)
+            if df is None:
+                break
+            number += 1
+
+            rows_read = int(df.index[-1]) + 1
+            if rows_read <= checkpoint.rows_committed and self.key_column:
+                continue
+
+            records, positions, rejects = self.normalize_chunk(df)
+            # rows committed by an earlier run only feed the occurrence counts
+            records = [record for record, position in zip(records, positions) if position >= checkpoint.rows_committed]
+            rejects = rejects[rejects.index >= checkpoint.rows_committed]
+            if not records and rejects.empty:
+                continue
+
+            created, updated = self.write_chunk(records, checkpoint, rows_read)
+            # only once the chunk is committed: a chunk that fails is read again by
+            # --resume, which would otherwise append its rejects a second time
+            with self.profiler.stage('rejects'):
+                rejected = rejects_file.write(rejects)
+            total_rows += len(records) + rejected
+            self.profiler.end_chunk(number, len(records) + rejected)
+            yield ChunkResult(number, len(records) + rejected, created, updated,
+                              len(records) - created - updated, rejected, total_rows)
+
+        checkpoint.completed = True
+        checkpoint.save(update_fields=['completed', 'updated_at'])
@@ -0,0 +1,160 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.db import connection
+from django.db.models import signals
+from django.utils import timezone
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+MODEL_SIGNALS = (
+    signals.pre_save,
+    signals.post_save,
+    signals.pre_delete,
+    signals.post_delete,
+    signals.m2m_changed,
+)
+
+
+def peak_memory_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class NullProfiler:
+    """
+        description: Stand-in used when profiling is off; every hook is a no-op
+    """
+    enabled = False
+
+    def stage(self, name):
+        return nullcontext()
+
+    def capture(self):
+        return nullcontext()
+
+    def begin_chunk(self):
+        pass
+
+    def end_chunk(self, number, rows):
+        pass
+
+
+class IngestionProfiler:
+    """
+        description: Times every ingestion stage (exclusive of nested stages), counts and
+                     times SQL queries and signal handlers per chunk, and writes the whole
+                     run as a JSON report
+    """
+    enabled = True
+
+    def __init__(self, **run_info):
+        self.run_info = run_info
+        self.stages = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.chunks = []
+        self._stack = []
+        self._chunk = None
+        self._started = None
+        self._elapsed = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self._add(self.stages, name, elapsed - nested)
+            if self._chunk is not None:
+                self._add(self._chunk['stages'], name, elapsed - nested)
+
+    def _add(self, stages, name, seconds):
+        stages[name] = stages.get(name, 0.0) + seconds
+
+    def _record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.query_seconds += elapsed
+            if self._chunk is not None:
+                self._chunk['queries'] += 1
+                self._chunk['query_seconds'] += elapsed
+
+    def _timed_send(self, send):
+        def timed_send(*args, **kwargs):
+            with self.stage('signals'):
+                return send(*args, **kwargs)
+        return timed_send
+
+    @contextmanager
+    def capture(self):
+        """
+        hooks the database connection and the model signals for the duration of a run
+        """
+        originals = [(signal, signal.__dict__.get('send')) for signal in MODEL_SIGNALS]
+        for signal in MODEL_SIGNALS:
+            signal.send = self._timed_send(signal.send)
+        self._started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self._record_query):
+                yield self
+        finally:
+            self._elapsed = time.perf_counter() - self._started
+            for signal, original in originals:
+                if original is None:
+                    del signal.send
+                else:
+                    signal.send = original
+
+    def begin_chunk(self):
+        self._chunk = {'started': time.perf_counter(), 'stages': {}, 'queries': 0, 'query_seconds': 0.0}
+
+    def end_chunk(self, number, rows):
+        chunk, self._chunk = self._chunk, None
+        seconds = time.perf_counter() - chunk.pop('started')
+        self.chunks.append({
+            'number': number,
+            'rows': rows,
+            'seconds': seconds,
+            'rows_per_second': rows / seconds if seconds else None,
+            'queries': chunk['queries'],
+            'query_seconds': chunk['query_seconds'],
+            'peak_memory_bytes': peak_memory_bytes(),
+            'stages': chunk['stages'],
+        })
+        return self.chunks[-1]
+
+    def report(self):
+        rows = sum(chunk['rows'] for chunk in self.chunks)
+        return {
+            **self.run_info,
+            'finished_at': timezone.now().isoformat(),
+            'rows': rows,
+            'seconds': self._elapsed,
+            'rows_per_second': rows / self._elapsed if self._elapsed else None,
+            'peak_memory_bytes': peak_memory_bytes(),
+            'queries': self.queries,
+            'query_seconds': self.query_seconds,
+            'stages': self.stages,
+            'chunks': self.chunks,
+        }
+
+    def write_report(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.export import AnimalExporter, CHUNK_SIZE, FORMATS
+from core.models import AnimalOnboarding
+
+
+class Command(BaseCommand):
+    help = "Exporting the animal registry as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=sorted(FORMATS), default='ndjson',
+                            help='Output format')
+        parser.add_argument('--output', default=None,
+                            help='File to write to (default: stdout)')
+        parser.add_argument('--with-health', action='store_true',
+                            help='Add the latest AnimalHealth record of every animal as health_* columns')
+        parser.add_argument('--species', default=None,
+                            help='Only export animals of this species')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows fetched from the server-side cursor at a time')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be a positive integer')
+
+        queryset = AnimalOnboarding.objects.all()
+        if options['species']:
+            queryset = queryset.filter(species=options['species'])
+
+        exporter = AnimalExporter(
+            queryset,
+            file_format=options['file_format'],
+            with_health=options['with_health'],
+            chunk_size=options['chunk_size'],
+        )
+
+        if options['output'] is None:
+            for text in exporter:
+                self.stdout.write(text, ending='')
+            return
+
+        with open(options['output'], 'w', newline='') as f:
+            for text in exporter:
+                f.write(text)
+        self.stderr.write(self.style.SUCCESS(f"EXPORTED ANIMALS TO {options['output']}"))
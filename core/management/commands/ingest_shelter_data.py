@@ -1,39 +1,105 @@
 from django.core.management.base import BaseCommand, CommandError
 from core.models import *
-import pandas as pd
+from core.ingestion import IngestionPipeline, IngestionProfiler, BACKENDS
 
 
 class Command(BaseCommand):
     help = "Ingesting base data to get going"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/app/data/animal_onboarding_ingestion.csv',
+                            help='CSV export to ingest')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows read, built and inserted per transaction')
+        parser.add_argument('--registered-by', type=int, default=16,
+                            help='ShelterUser id the animals are registered by')
+        parser.add_argument('--backend', choices=sorted(BACKENDS), default='orm',
+                            help='orm: bulk_create (any database); copy: COPY FROM STDIN (PostgreSQL, '
+                                 'falls back to orm elsewhere)')
+        parser.add_argument('--key-column', default=None,
+                            help='Column holding the source system id; changed rows are then updated in place '
+                                 'instead of being skipped')
+        parser.add_argument('--reject-file', default=None,
+                            help='Where rows failing validation are written (default: <path>.rejects.csv)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue after the last chunk committed for this file')
+        parser.add_argument('--profile', action='store_true',
+                            help='Time every stage, count SQL queries per chunk and write a JSON report')
+        parser.add_argument('--profile-report', default=None,
+                            help='Where the --profile report is written (default: <path>.profile.json)')
+
     def handle(self, *args, **options):
-        df = pd.read_csv('/app/data/animal_onboarding_ingestion.csv')
-
-        index = 0
-        for index, row in df.iterrows():
-
-            ao_obj = AnimalOnboarding.objects.create(
-                    breed = row['parent_breed'],
-                    intake_type = row['intake_type'].lower().replace(' ', '_'),
-                    age_in_years = row['age_upon_intake_(years)'],
-                    month_of_intake = row['intake_month'],
-                    colour = row['color_combination'],
-                    species = row['animal_type'],
-                    gender = row['sex_of_animal'].lower(),
-                    is_mix = True if row['is_mix'] == 'Yes' else False,
-                    registered_by = ShelterUser.objects.get(id=16)
-                )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive integer')
 
-            ao_obj.save()
+        try:
+            registered_by = ShelterUser.objects.get(id=options['registered_by'])
+        except ShelterUser.DoesNotExist:
+            raise CommandError(f"ShelterUser {options['registered_by']} does not exist")
 
-            ah_obj = AnimalHealth.objects.create(
-                    animal = ao_obj,
-                    intake_condition = row['intake_condition'],
-                    neutering_status = row['neutering_status'].lower(),
-                )
+        profiler = None
+        if options['profile']:
+            profiler = IngestionProfiler(
+                source=options['path'],
+                backend=options['backend'],
+                batch_size=options['batch_size'],
+            )
+
+        pipeline = IngestionPipeline(
+            options['path'],
+            registered_by=registered_by,
+            batch_size=options['batch_size'],
+            backend=options['backend'],
+            key_column=options['key_column'],
+            resume=options['resume'],
+            reject_path=options['reject_file'],
+            profiler=profiler,
+        )
+
+        if pipeline.backend.name != options['backend']:
+            self.stdout.write(self.style.WARNING(
+                f"{options['backend']} backend is not available on this database, using {pipeline.backend.name}"
+            ))
 
-            ah_obj.save()
+        if profiler is None:
+            self.ingest(pipeline)
+            return
 
+        profiler.run_info['backend'] = pipeline.backend.name
+        with profiler.capture():
+            self.ingest(pipeline)
+        report_path = options['profile_report'] or f"{options['path']}.profile.json"
+        profiler.write_report(report_path)
+        self.write_profile_summary(profiler.report(), report_path)
+
+    def ingest(self, pipeline):
+        chunk = None
+        for chunk in pipeline.run():
             self.stdout.write(
-                self.style.SUCCESS(f'DATA INGESTED FOR ANIMAL NO. {index+1}')
-            )
\ No newline at end of file
+                self.style.SUCCESS(
+                    f'CHUNK {chunk.number}: {chunk.created} NEW, {chunk.updated} UPDATED, '
+                    f'{chunk.unchanged} UNCHANGED, {chunk.rejected} REJECTED ({chunk.total_rows} ROWS IN TOTAL)'
+                )
+            )
+            if pipeline.profiler.enabled:
+                profile = pipeline.profiler.chunks[-1]
+                self.stdout.write(
+                    f"    {profile['rows_per_second']:.0f} rows/s, {profile['queries']} queries "
+                    f"in {profile['query_seconds']:.3f}s"
+                )
+
+        if chunk is None:
+            self.stdout.write(self.style.SUCCESS('NOTHING LEFT TO INGEST FOR THIS FILE'))
+
+    def write_profile_summary(self, report, report_path):
+        self.stdout.write(self.style.MIGRATE_HEADING('INGESTION PROFILE'))
+        for stage, seconds in sorted(report['stages'].items(), key=lambda item: item[1], reverse=True):
+            self.stdout.write(f'    {stage:<12} {seconds:10.3f}s')
+        rows_per_second = report['rows_per_second'] or 0
+        self.stdout.write(
+            f"    {report['rows']} rows in {report['seconds']:.3f}s ({rows_per_second:.0f} rows/s), "
+            f"{report['queries']} queries in {report['query_seconds']:.3f}s"
+        )
+        if report['peak_memory_bytes'] is not None:
+            self.stdout.write(f"    peak memory {report['peak_memory_bytes'] / 1024 / 1024:.1f} MiB")
+        self.stdout.write(self.style.SUCCESS(f'PROFILE REPORT WRITTEN TO {report_path}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from core.statistics import rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = "Recounting the ShelterStatistic rollups from the source tables and fixing any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the buckets that drifted')
+
+    def handle(self, *args, **options):
+        drift = rebuild_statistics(dry_run=options['dry_run'])
+        for dimension, bucket, stored, actual in drift:
+            self.stdout.write(f'{dimension}={bucket!r}: stored {stored}, actual {actual}')
+        if options['dry_run']:
+            self.stdout.write(f'{len(drift)} BUCKETS DRIFTED')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'FIXED {len(drift)} BUCKETS'))
@@ -0,0 +1,102 @@
+"""
+    description: Response compression negotiated from Accept-Encoding: brotli when the
+                 client accepts it and the brotli package is installed, gzip otherwise.
+                 Small responses are left alone; settings.API_COMPRESSION holds the
+                 threshold and the compression levels.
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+DEFAULTS = {
+    'MIN_LENGTH': 1024,
+    'BROTLI_QUALITY': 4,
+}
+
+
+def accepted_encodings(header):
+    """
+    {encoding: q} from an Accept-Encoding header
+    """
+    encodings = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            encodings[name.strip().lower()] = q
+    return encodings
+
+
+def brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    # random bytes in the gzip header, as GZipMiddleware adds against BREACH
+    max_random_bytes = 100
+
+    def __init__(self, get_response):
+        # MiddlewareMixin keeps async views async under ASGI
+        super().__init__(get_response)
+        self.options = {**DEFAULTS, **getattr(settings, 'API_COMPRESSION', {})}
+
+    def choose_encoding(self, request):
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        candidates = (['br'] if brotli is not None else []) + ['gzip']
+        # the client's preference wins; on a tie the first candidate (brotli) does
+        best = max(candidates, key=lambda name: encodings.get(name, encodings.get('*', 0.0)))
+        return best if encodings.get(best, encodings.get('*', 0.0)) > 0 else None
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < self.options['MIN_LENGTH']:
+            return response
+        if response.has_header('Content-Encoding') or getattr(response, 'is_async', False):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self.choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = brotli_sequence(response.streaming_content,
+                                                             self.options['BROTLI_QUALITY'])
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content,
+                                                               max_random_bytes=self.max_random_bytes)
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=self.options['BROTLI_QUALITY'])
+            else:
+                compressed = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # a compressed body is a different representation: strong ETags become weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
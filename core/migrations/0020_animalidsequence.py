@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+from core.animal_ids import sequence_name
+
+
+SPECIES_PREFIXES = ['DOG', 'CAT', 'BIR', 'OTH']
+
+
+def create_sequences(apps, schema_editor):
+    # created up front rather than on first use, so a rolled back first
+    # allocation can never drop a sequence other workers already draw from
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for prefix in SPECIES_PREFIXES:
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {sequence_name(prefix)}')
+
+
+def drop_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for prefix in SPECIES_PREFIXES:
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {sequence_name(prefix)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_ingestioncheckpoint_animalonboarding_source_hash_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnimalIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=3, unique=True)),
+                ('next_block', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequences, drop_sequences),
+    ]
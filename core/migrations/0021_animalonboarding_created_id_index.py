@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_animalidsequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='animalonboarding',
+            index=models.Index(fields=['created_at', 'id'], name='core_animal_created_id_idx'),
+        ),
+    ]
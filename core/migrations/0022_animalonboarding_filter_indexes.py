@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_animalonboarding_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='animalonboarding',
+            name='registered_by',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='registered_animals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='animalonboarding',
+            index=models.Index(fields=['species', 'intake_type', 'month_of_intake', 'micro_chipped'], name='core_animal_sp_it_month_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animalonboarding',
+            index=models.Index(fields=['intake_type', 'month_of_intake'], name='core_animal_it_month_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animalonboarding',
+            index=models.Index(fields=['species', 'age_in_years'], name='core_animal_sp_age_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animalonboarding',
+            index=models.Index(fields=['registered_by', 'created_at'], name='core_animal_regby_created_idx'),
+        ),
+    ]
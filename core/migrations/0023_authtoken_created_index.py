@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # authtoken_token belongs to rest_framework.authtoken; the index on created lets
+    # the expiry sweep (purge_expired_tokens) find expired tokens without a full scan
+
+    dependencies = [
+        ('authtoken', '0004_alter_tokenproxy_options'),
+        ('core', '0022_animalonboarding_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS authtoken_token_created_idx ON authtoken_token (created)',
+            reverse_sql='DROP INDEX IF EXISTS authtoken_token_created_idx',
+        ),
+    ]
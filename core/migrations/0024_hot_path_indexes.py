@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_authtoken_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='shelteruser',
+            options={},
+        ),
+        migrations.AddIndex(
+            model_name='animalhealth',
+            index=models.Index(fields=['animal', 'created_at'], name='core_health_animal_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animalhealth',
+            index=models.Index(condition=models.Q(('is_rabid', False), models.Q(('vaccination_status', 'unknown'), _negated=True)), fields=['animal', 'created_at'], name='core_health_adoptable_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animalonboarding',
+            index=models.Index(fields=['species', 'intake_type', 'created_at'], name='core_animal_sp_it_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='awarenesscreation',
+            index=models.Index(fields=['attention_needed', 'created_at'], name='core_aware_attn_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outcomeprediction',
+            index=models.Index(fields=['animal', 'created_at'], name='core_outcome_anim_created_idx'),
+        ),
+        # the composite indexes above lead with animal_id: the FK's own index is redundant
+        migrations.AlterField(
+            model_name='animalhealth',
+            name='animal',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='health_info', to='core.animalonboarding'),
+        ),
+        migrations.AlterField(
+            model_name='outcomeprediction',
+            name='animal',
+            field=models.ForeignKey(db_index=False, default=None, on_delete=django.db.models.deletion.CASCADE, to='core.animalonboarding'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:51
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# frozen copy of core.statistics.DIMENSIONS
+DIMENSIONS = {
+    'AnimalOnboarding': (('species', 'species'), ('intake_type', 'intake_type'), ('month_of_intake', 'month_of_intake')),
+    'AnimalHealth': (('intake_condition', 'intake_condition'),),
+    'OutcomePrediction': (('outcome_type', 'outcome_type'),),
+}
+
+
+def count_existing_rows(apps, schema_editor):
+    ShelterStatistic = apps.get_model('core', 'ShelterStatistic')
+    statistics = []
+    for model_name, dimensions in DIMENSIONS.items():
+        model = apps.get_model('core', model_name)
+        for dimension, field in dimensions:
+            for value, count in model.objects.order_by().values_list(field).annotate(count=Count('pk')):
+                statistics.append(ShelterStatistic(
+                    dimension=dimension, bucket='' if value is None else str(value), count=count,
+                ))
+    ShelterStatistic.objects.bulk_create(statistics)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShelterStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('species', 'Species'), ('intake_type', 'Intake_type'), ('month_of_intake', 'Month_of_intake'), ('intake_condition', 'Intake_condition'), ('outcome_type', 'Outcome_type')], max_length=30)),
+                ('bucket', models.CharField(max_length=50)),
+                ('count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'bucket'), name='core_statistic_bucket_uniq')],
+            },
+        ),
+        migrations.RunPython(count_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def point_at_latest_health(apps, schema_editor):
+    AnimalOnboarding = apps.get_model('core', 'AnimalOnboarding')
+    AnimalHealth = apps.get_model('core', 'AnimalHealth')
+    latest = AnimalHealth.objects.filter(animal=OuterRef('pk')).order_by('-created_at', '-id').values('id')[:1]
+    # one UPDATE over core_health_animal_created_idx; updated_at stays as it was
+    AnimalOnboarding.objects.update(current_health=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_shelterstatistic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='animalonboarding',
+            name='current_health',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.animalhealth'),
+        ),
+        migrations.RunPython(point_at_latest_health, migrations.RunPython.noop),
+    ]
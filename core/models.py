@@ -1,17 +1,24 @@
 from django.db import models
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
 from django.contrib.auth.models import (AbstractBaseUser, 
                                        BaseUserManager,
                                        PermissionsMixin)
 from django.utils.crypto import get_random_string
-import random
-import string
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.core.validators import MaxValueValidator, MinValueValidator
 from rest_framework.authtoken.models import Token
+from core.animal_ids import allocator
+from core.signals import animals_bulk_changed
 
 # Create your models here.
 
+# an AnimalHealth record that makes its animal adoptable: AnimalHealth.adoptable, the
+# core_health_adoptable_idx partial index and the adoptable listing filter all use it
+ADOPTABLE = models.Q(is_rabid=False) & ~models.Q(vaccination_status='unknown')
+ADOPTABLE_FIELDS = ('is_rabid', 'vaccination_status')
+
 
 # MODELS FOR INTERNAL USE
 class ShelterUserManager(BaseUserManager):
@@ -58,9 +65,6 @@ class ShelterUser(AbstractBaseUser):
 
     objects = ShelterUserManager()
     USERNAME_FIELD = 'email'
-    
-    class Meta:
-        ordering = ['created_at']
 
     def has_perm(self, perm, obj=None):
         """Does the user have a specific permission?"""
@@ -78,6 +82,25 @@ def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
 
+class AnimalOnboardingQuerySet(models.QuerySet):
+
+    def with_adoptable(self):
+        """
+        annotates `adoptable`: whether the animal's current (latest) health record is
+        adoptable; False for an animal without one. A primary key lookup per animal
+        """
+        return self.annotate(adoptable=Exists(AnimalHealth.objects.filter(ADOPTABLE, pk=OuterRef('current_health'))))
+
+    def refresh_current_health(self):
+        """
+        points current_health of every animal in the queryset at its latest AnimalHealth
+        record (None without one) with one UPDATE, walking core_health_animal_created_idx
+        """
+        latest = AnimalHealth.objects.filter(animal=OuterRef('pk')).order_by('-created_at', '-id').values('id')[:1]
+        # updated_at moves too: the listing's validators have to see the change
+        return self.update(current_health=Subquery(latest), updated_at=timezone.now())
+
+
 class AnimalOnboarding(models.Model):
     """
         description: Animal registration
@@ -117,18 +140,57 @@ class AnimalOnboarding(models.Model):
     distinctive_features = models.CharField(max_length=50, null=True, blank=True)
     is_mix = models.BooleanField(default=False)
     micro_chipped = models.BooleanField(default=False)
-    registered_by = models.ForeignKey(ShelterUser, on_delete=models.CASCADE, related_name='registered_animals') #one user can register multiple animals; one-to-many
+    registered_by = models.ForeignKey(ShelterUser, on_delete=models.CASCADE, related_name='registered_animals', db_index=False) #one user can register multiple animals; one-to-many; indexed through (registered_by, created_at)
+    source_key = models.CharField(max_length=64, editable=False, unique=True, null=True) #identity of the source row for records loaded by ingest_shelter_data
+    source_hash = models.CharField(max_length=32, editable=False, null=True) #content hash of the source row, to skip unchanged rows on re-runs
+    current_health = models.ForeignKey('AnimalHealth', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+') #the latest AnimalHealth record, kept current on every insert/delete of one
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AnimalOnboardingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pagination of /animal/list/ seeks on (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='core_animal_created_id_idx'),
+            # filter combinations used by the animal listing, e.g. stray cats from June, not microchipped
+            models.Index(fields=['species', 'intake_type', 'month_of_intake', 'micro_chipped'],
+                         name='core_animal_sp_it_month_idx'),
+            models.Index(fields=['intake_type', 'month_of_intake'], name='core_animal_it_month_idx'),
+            models.Index(fields=['species', 'age_in_years'], name='core_animal_sp_age_idx'),
+            models.Index(fields=['registered_by', 'created_at'], name='core_animal_regby_created_idx'),
+            # newest intakes of a species / intake type, e.g. the latest stray dogs
+            models.Index(fields=['species', 'intake_type', 'created_at'], name='core_animal_sp_it_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.animal_id} registered by: {self.registered_by}"
 
-def generate_random_code():
+class AnimalIdSequence(models.Model):
     """
-    a random alphanumeric string
+        description: Block counter per species prefix for the animal id allocator on databases
+                     without sequences (PostgreSQL uses a native sequence per prefix instead)
     """
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    prefix = models.CharField(max_length=3, unique=True)
+    next_block = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefix}: next block {self.next_block}"
+
+def generate_animal_ids(species):
+    """
+    one unique animal id per entry in `species`, handed out from pre-reserved blocks
+    """
+    return allocator.allocate_many(species)
+
+def assign_animal_ids(animals):
+    """
+    assigns animal ids up front for objects that skip the pre_save signal (bulk_create)
+    """
+    pending = [animal for animal in animals if not animal.animal_id]
+    for animal, animal_id in zip(pending, generate_animal_ids([animal.species for animal in pending])):
+        animal.animal_id = animal_id
+    return animals
 
 @receiver(pre_save, sender=AnimalOnboarding)
 def set_animal_id(sender, instance, **kwargs):
@@ -136,9 +198,52 @@ def set_animal_id(sender, instance, **kwargs):
     pre-save django signal to save an unique id against an animal
     """
     if not instance.animal_id:
-        species_prefix = instance.species[:3].upper()
-        alphanum_code = generate_random_code()
-        instance.animal_id = f"{species_prefix}-{alphanum_code}"
+        instance.animal_id = allocator.allocate(instance.species)[0]
+
+class IngestionCheckpoint(models.Model):
+    """
+        description: Progress of an ingest_shelter_data run over one source file, committed
+                     together with every chunk so an interrupted run can resume
+    """
+    source = models.CharField(max_length=255, unique=True)
+    signature = models.CharField(max_length=64) #size + leading bytes of the file; a different file restarts from zero
+    rows_committed = models.PositiveBigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.rows_committed} rows committed"
+
+
+class ShelterStatistic(models.Model):
+    """
+        description: Dashboard rollup: how many rows fall in one bucket of one dimension,
+                     e.g. ('species', 'dog') -> 1520. Kept current incrementally by
+                     core.statistics; rebuild_statistics recounts from scratch
+    """
+
+    DIMENSION_CHOICES = (
+        ('species', 'Species'),
+        ('intake_type', 'Intake_type'),
+        ('month_of_intake', 'Month_of_intake'),
+        ('intake_condition', 'Intake_condition'),
+        ('outcome_type', 'Outcome_type'),
+    )
+
+    dimension = models.CharField(max_length=30, choices=DIMENSION_CHOICES)
+    bucket = models.CharField(max_length=50) #the field value as text
+    count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # the conflict target of the incremental upsert
+            models.UniqueConstraint(fields=['dimension', 'bucket'], name='core_statistic_bucket_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}={self.bucket}: {self.count}"
 
 class AnimalDocuments(models.Model):
     """
@@ -194,7 +299,7 @@ class AnimalHealth(models.Model):
         ('unknown', 'Unkwown')
     )
 
-    animal = models.ForeignKey(AnimalOnboarding, on_delete=models.CASCADE, related_name='health_info') #one specific health record per animal, thus one-to-many (Foreign Key)
+    animal = models.ForeignKey(AnimalOnboarding, on_delete=models.CASCADE, related_name='health_info', db_index=False) #one specific health record per animal, thus one-to-many (Foreign Key); indexed through (animal, created_at)
     intake_condition = models.CharField(max_length=50, null=False, choices=OVERALL_HEALTH_STATUS_CHOICES)
     current_medications = models.CharField(max_length=50, null=True, blank=True)
     is_rabid = models.BooleanField(default=False)
@@ -209,16 +314,46 @@ class AnimalHealth(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # an animal's records newest first: the latest record, health history
+            models.Index(fields=['animal', 'created_at'], name='core_health_animal_created_idx'),
+            # only records that make an animal adoptable (see adoptable below)
+            models.Index(fields=['animal', 'created_at'], name='core_health_adoptable_idx', condition=ADOPTABLE),
+        ]
+
     def __str__(self):
         return f"Created instance for: {self.animal}"
 
     @property
     def adoptable(self):
+        # the Python side of ADOPTABLE, for a record already loaded
         if self.is_rabid == False and self.vaccination_status != 'unknown':
             return True
         else:
             return False
 
+
+@receiver(post_save, sender=AnimalHealth)
+@receiver(post_delete, sender=AnimalHealth)
+def refresh_current_health(sender, instance, created=True, raw=False, update_fields=None, **kwargs):
+    """
+    a new or deleted record can change which one is the latest; an edit in place of the
+    latest one can change whether its animal is adoptable, so the animal counts as
+    updated (updated_at and the listing cache) as well
+    """
+    if raw:
+        return
+    animals = AnimalOnboarding.objects.filter(pk=instance.animal_id)
+    if created:
+        animals.refresh_current_health()
+    elif update_fields is not None and not set(update_fields) & set(ADOPTABLE_FIELDS):
+        return
+    elif not animals.filter(current_health=instance.pk).update(updated_at=timezone.now()):
+        # not the current record: nothing reads it through the animal
+        return
+    animals_bulk_changed.send(sender=AnimalOnboarding, created=0, updated=1)
+
 class PreviousOwnerInfo(models.Model):
     """
         description: Previous owner information
@@ -327,11 +462,17 @@ class OutcomePrediction(models.Model):
         (4, 'Transfer')
     ]
     
-    animal = models.ForeignKey(AnimalOnboarding, on_delete=models.CASCADE, default=None)
+    animal = models.ForeignKey(AnimalOnboarding, on_delete=models.CASCADE, default=None, db_index=False) #indexed through (animal, created_at)
     outcome_type = models.IntegerField(choices=OUTCOME_TYPE_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # the latest prediction for an animal
+            models.Index(fields=['animal', 'created_at'], name='core_outcome_anim_created_idx'),
+        ]
+
     def __str__(self):
         return f"Outcome: {self.outcome_type}"
 
@@ -384,6 +525,12 @@ class AwarenessCreation(models.Model):
     additional_comments = models.TextField(max_length=500, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # the triage queue: reports of a priority, newest first
+            models.Index(fields=['attention_needed', 'created_at'], name='core_aware_attn_created_idx'),
+        ]
  
     def __str__(self):
         return "Found an animal at location:" + self.found_animal_at_location + "- priority:", self.attention_needed
\ No newline at end of file
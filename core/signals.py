@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# sent (sender=AnimalOnboarding) once a bulk write that bypasses the model signals has
+# committed: ingestion chunks, bulk_create / bulk_update / queryset.update() paths
+animals_bulk_changed = Signal()
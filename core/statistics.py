@@ -0,0 +1,172 @@
+"""
+    description: Incrementally maintained dashboard counts (ShelterStatistic)
+
+    Every write to a tracked model turns into +1/-1 deltas per (dimension, bucket), and a
+    batch of deltas is applied with one INSERT ... ON CONFLICT DO UPDATE that adds to
+    the stored counts, inside the writer's transaction. Single saves and deletes go
+    through the model signals below; bulk paths (ingestion, /animal/bulk/) build a
+    StatisticsDelta themselves. Reads are one row per bucket, whatever the table sizes.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import AnimalHealth, AnimalOnboarding, OutcomePrediction, ShelterStatistic
+
+
+# model -> (dimension, field) pairs it feeds
+DIMENSIONS = {
+    AnimalOnboarding: (('species', 'species'), ('intake_type', 'intake_type'), ('month_of_intake', 'month_of_intake')),
+    AnimalHealth: (('intake_condition', 'intake_condition'),),
+    OutcomePrediction: (('outcome_type', 'outcome_type'),),
+}
+
+
+def bucket(value):
+    return '' if value is None else str(value)
+
+
+def field_value(source, field):
+    # model instances and ingestion records (dicts) alike
+    return source[field] if isinstance(source, dict) else getattr(source, field)
+
+
+class StatisticsDelta:
+    """
+        description: Pending count changes per (dimension, bucket); apply() writes them
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def add(self, model, source, sign=1):
+        """
+        counts `source` (a `model` instance or a record dict) in, or out with sign=-1
+        """
+        for dimension, field in DIMENSIONS[model]:
+            self.counts[dimension, bucket(field_value(source, field))] += sign
+
+    def remove(self, model, source):
+        self.add(model, source, sign=-1)
+
+    def apply(self):
+        """
+        one upsert for every non-zero delta
+        """
+        changes = sorted((key, count) for key, count in self.counts.items() if count)
+        self.counts.clear()
+        if not changes:
+            return
+        quote = connection.ops.quote_name
+        table = quote(ShelterStatistic._meta.db_table)
+        now = timezone.now()
+        params = []
+        for (dimension, value), count in changes:
+            params += [dimension, value, count, now]
+        # sorted, so concurrent writers lock the bucket rows in the same order
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({quote("dimension")}, {quote("bucket")}, {quote("count")}, '
+                f'{quote("updated_at")}) VALUES {", ".join(["(%s, %s, %s, %s)"] * len(changes))} '
+                f'ON CONFLICT ({quote("dimension")}, {quote("bucket")}) DO UPDATE SET '
+                f'{quote("count")} = {table}.{quote("count")} + EXCLUDED.{quote("count")}, '
+                f'{quote("updated_at")} = EXCLUDED.{quote("updated_at")}',
+                params,
+            )
+
+
+def read_statistics(dimensions=None):
+    """
+    {dimension: {bucket: count}}, empty buckets left out
+    """
+    queryset = ShelterStatistic.objects.filter(count__gt=0)
+    if dimensions is not None:
+        queryset = queryset.filter(dimension__in=dimensions)
+    statistics = {dimension: {} for dimension, _ in ShelterStatistic.DIMENSION_CHOICES
+                  if dimensions is None or dimension in dimensions}
+    for dimension, value, count in queryset.order_by('dimension', 'bucket').values_list('dimension', 'bucket', 'count'):
+        statistics[dimension][value] = count
+    return statistics
+
+
+def count_buckets():
+    """
+    the true counts, with a GROUP BY per dimension over the source tables
+    """
+    counts = Counter()
+    for model, dimensions in DIMENSIONS.items():
+        for dimension, field in dimensions:
+            for value, count in model.objects.order_by().values_list(field).annotate(count=Count('pk')):
+                counts[dimension, bucket(value)] = count
+    return counts
+
+
+def rebuild_statistics(dry_run=False):
+    """
+    recounts every bucket and fixes the stored counts that drifted; returns the drift as
+    (dimension, bucket, stored, actual) tuples
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql' and not dry_run:
+            # taken before counting: writers block on their next upsert until the new
+            # counts are in, so nothing committed in between is lost or counted twice
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {connection.ops.quote_name(ShelterStatistic._meta.db_table)} '
+                               'IN SHARE ROW EXCLUSIVE MODE')
+        actual = count_buckets()
+        stored = {(dimension, value): count for dimension, value, count
+                  in ShelterStatistic.objects.values_list('dimension', 'bucket', 'count')}
+        drift = sorted(
+            (dimension, value, stored.get((dimension, value), 0), actual.get((dimension, value), 0))
+            for dimension, value in set(actual) | set(stored)
+            if stored.get((dimension, value), 0) != actual.get((dimension, value), 0)
+        )
+        if drift and not dry_run:
+            delta = StatisticsDelta()
+            for dimension, value, stored_count, actual_count in drift:
+                delta.counts[dimension, value] = actual_count - stored_count
+            delta.apply()
+    return drift
+
+
+@receiver(pre_save, sender=AnimalOnboarding)
+@receiver(pre_save, sender=AnimalHealth)
+@receiver(pre_save, sender=OutcomePrediction)
+def remember_buckets(sender, instance, update_fields=None, **kwargs):
+    """
+    an update needs the values it replaces: one query, skipped when update_fields
+    leaves the tracked fields alone
+    """
+    instance._statistics_before = None
+    if instance._state.adding or instance.pk is None:
+        return
+    fields = [field for _, field in DIMENSIONS[sender]]
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    instance._statistics_before = sender._base_manager.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(post_save, sender=AnimalOnboarding)
+@receiver(post_save, sender=AnimalHealth)
+@receiver(post_save, sender=OutcomePrediction)
+def count_saved(sender, instance, created=False, **kwargs):
+    delta = StatisticsDelta()
+    if created:
+        delta.add(sender, instance)
+    elif getattr(instance, '_statistics_before', None) is not None:
+        delta.remove(sender, instance._statistics_before)
+        delta.add(sender, instance)
+    delta.apply()
+
+
+@receiver(post_delete, sender=AnimalOnboarding)
+@receiver(post_delete, sender=AnimalHealth)
+@receiver(post_delete, sender=OutcomePrediction)
+def count_deleted(sender, instance, **kwargs):
+    delta = StatisticsDelta()
+    delta.remove(sender, instance)
+    delta.apply()
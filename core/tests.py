@@ -1,3 +1,472 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import re
+import tempfile
+import threading
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.animal_ids import BLOCK_SIZE, AnimalIdAllocator, encode
+from core.ingestion import IngestionPipeline
+from core.ingestion.backends import ANIMAL_FIELDS, HEALTH_FIELDS, OrmBackend
+from core.middleware import CompressionMiddleware, accepted_encodings, brotli
+from core.models import (
+    AnimalHealth,
+    AnimalOnboarding,
+    AwarenessCreation,
+    OutcomePrediction,
+    ShelterStatistic,
+    ShelterUser,
+    assign_animal_ids,
+)
+from core.renderers import ORJSONParser, ORJSONRenderer
+from core.statistics import count_buckets, read_statistics, rebuild_statistics
 
 # Create your tests here.
+
+
+def create_user(email='staff@shelter.org', **fields):
+    return ShelterUser.objects.create_user(
+        email, 'password', **{'name': 'staff', 'phone_number': '1234567890', 'location': 'Pune', **fields}
+    )
+
+
+def seed_animals(user, count=600):
+    species = ['dog', 'cat', 'bird', 'other']
+    intake_types = ['stray', 'owner_surrender', 'public_assist', 'wildlife']
+    genders = ['male', 'female', 'unknown']
+    animals = [
+        AnimalOnboarding(
+            species=species[i % 4],
+            intake_type=intake_types[(i // 4) % 4],
+            gender=genders[i % 3],
+            month_of_intake=i % 12 + 1,
+            age_in_years=(i % 15) * 0.5,
+            weight_in_kgs=(i % 40) * 1.5,
+            is_mix=i % 2 == 0,
+            micro_chipped=i % 5 == 0,
+            registered_by=user,
+        )
+        for i in range(count)
+    ]
+    assign_animal_ids(animals)
+    return AnimalOnboarding.objects.bulk_create(animals)
+
+
+class QueryPlanAssertions:
+    """
+    asserts the planner *can* answer a query from an index. On PostgreSQL sequential
+    scans are disabled for the current transaction, as a small seeded table would
+    otherwise always be scanned; with ordered=True explicit sorts are disabled too.
+    """
+
+    def assertUsesIndex(self, queryset, index_name, ordered=False):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                if ordered:
+                    # the index has to deliver the ORDER BY, not just the matching rows
+                    cursor.execute('SET LOCAL enable_sort = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'{index_name} not used by:\n{plan}')
+
+
+class ORJSONRendererTests(SimpleTestCase):
+
+    def test_output_matches_json_renderer(self):
+        data = {'results': [{'id': 1, 'name': 'Bruno ', 'weight': Decimal('1.50'), 'tags': ['a', None]}],
+                'count': 1, 2: True}
+        rendered = ORJSONRenderer().render(data)
+        self.assertEqual(json.loads(rendered), json.loads(JSONRenderer().render(data)))
+        self.assertIn(b'\\u2028', rendered)
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_parser_round_trip(self):
+        payload = [{'species': 'dog', 'age_in_years': 2.5}]
+        self.assertEqual(ORJSONParser().parse(BytesIO(ORJSONRenderer().render(payload))), payload)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = b'{"results": [' + b'{"species": "dog"},' * 200 + b'{}]}'
+
+    def respond(self, accept_encoding, response):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip;q=0.5, br, identity;q=0'), {'gzip': 0.5, 'br': 1.0, 'identity': 0.0})
+
+    def test_gzip(self):
+        response = HttpResponse(self.body, content_type='application/json', headers={'ETag': '"abc"'})
+        response = self.respond('gzip, deflate', response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_brotli_preferred_when_available(self):
+        response = self.respond('gzip, br', HttpResponse(self.body))
+        if brotli is None:
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+        else:
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertEqual(brotli.decompress(response.content), self.body)
+        self.assertEqual(self.respond('gzip, br;q=0.1', HttpResponse(self.body))['Content-Encoding'], 'gzip')
+
+    def test_small_or_unaccepted_responses_are_untouched(self):
+        self.assertFalse(self.respond('gzip', HttpResponse(b'{}')).has_header('Content-Encoding'))
+        self.assertFalse(self.respond('identity', HttpResponse(self.body)).has_header('Content-Encoding'))
+        self.assertFalse(self.respond('', HttpResponse(self.body)).has_header('Content-Encoding'))
+
+    def test_streaming(self):
+        response = self.respond('gzip', StreamingHttpResponse(iter([self.body, self.body])))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.body * 2)
+
+
+class HotPathIndexTests(QueryPlanAssertions, TestCase):
+    """
+    the hot query paths stay index scans on a seeded dataset
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = create_user()
+        animals = [
+            AnimalOnboarding(species=('dog', 'cat', 'bird', 'other')[i % 4],
+                             intake_type=('stray', 'owner_surrender', 'public_assist', 'wildlife')[i // 4 % 4],
+                             registered_by=user)
+            for i in range(320)
+        ]
+        assign_animal_ids(animals)
+        animals = AnimalOnboarding.objects.bulk_create(animals)
+        health = AnimalHealth.objects.bulk_create(
+            AnimalHealth(animal=animal, intake_condition='normal', is_rabid=i % 7 == 0,
+                         vaccination_status=('up_to_date', 'unknown')[i % 4 == 0])
+            for i, animal in enumerate(animals)
+        )
+        OutcomePrediction.objects.bulk_create(OutcomePrediction(animal=animal, outcome_type=0) for animal in animals)
+        AwarenessCreation.objects.bulk_create(
+            AwarenessCreation(user_details=user, animal_onboarding=animal, animal_health=record,
+                              found_animal_at_location='Pune', attention_needed=('low', 'high')[i % 2])
+            for i, (animal, record) in enumerate(zip(animals, health))
+        )
+        cls.animal = animals[0]
+
+    def test_latest_intakes_of_a_species(self):
+        self.assertUsesIndex(
+            AnimalOnboarding.objects.filter(species='dog', intake_type='stray').order_by('-created_at')[:20],
+            'core_animal_sp_it_created_idx', ordered=True,
+        )
+
+    def test_latest_health_record(self):
+        self.assertUsesIndex(
+            AnimalHealth.objects.filter(animal=self.animal).order_by('-created_at')[:1],
+            'core_health_animal_created_idx', ordered=True,
+        )
+
+    def test_adoptable_records(self):
+        self.assertUsesIndex(
+            AnimalHealth.objects.filter(animal=self.animal, is_rabid=False).exclude(vaccination_status='unknown'),
+            'core_health_adoptable_idx',
+        )
+
+    def test_latest_outcome_prediction(self):
+        self.assertUsesIndex(
+            OutcomePrediction.objects.filter(animal=self.animal).order_by('-created_at')[:1],
+            'core_outcome_anim_created_idx', ordered=True,
+        )
+
+    def test_awareness_triage_queue(self):
+        self.assertUsesIndex(
+            AwarenessCreation.objects.filter(attention_needed='high').order_by('-created_at')[:20],
+            'core_aware_attn_created_idx', ordered=True,
+        )
+
+    def test_user_lookup_by_email_is_not_sorted(self):
+        self.assertFalse(ShelterUser.objects.filter(email='staff@shelter.org').query.order_by)
+        self.assertFalse(ShelterUser._meta.ordering)
+
+
+class ShelterStatisticsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_animal(self, species='dog', **fields):
+        return AnimalOnboarding.objects.create(species=species, registered_by=self.user, **fields)
+
+    def assertStatisticsAccurate(self):
+        stored = {(dimension, bucket): count for dimension, bucket, count
+                  in ShelterStatistic.objects.filter(count__gt=0).values_list('dimension', 'bucket', 'count')}
+        self.assertEqual(stored, dict(count_buckets()))
+
+    def test_single_saves_and_deletes(self):
+        dog = self.create_animal('dog', month_of_intake=6)
+        cat = self.create_animal('cat')
+        AnimalHealth.objects.create(animal=dog, intake_condition='injured')
+        OutcomePrediction.objects.create(animal=cat, outcome_type=0)
+        self.assertEqual(read_statistics(['species']), {'species': {'cat': 1, 'dog': 1}})
+
+        cat.species = 'bird'
+        cat.save()
+        # no tracked field in update_fields: no lookup of the old values
+        with self.assertNumQueries(1):
+            dog.breed = 'Beagle'
+            dog.save(update_fields=['breed'])
+        self.assertEqual(read_statistics(['species'])['species'], {'bird': 1, 'dog': 1})
+
+        dog.delete()
+        self.assertEqual(read_statistics(['intake_condition'])['intake_condition'], {})
+        self.assertStatisticsAccurate()
+
+    def test_bulk_endpoint_and_ingestion_paths(self):
+        response = self.client.post('/animal/bulk/', [
+            {'species': 'dog', 'gender': 'male', 'health': {'intake_condition': 'injured'}},
+            {'species': 'cat', 'gender': 'female', 'month_of_intake': 2},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        cat_id = response.json()['created'][1]['id']
+        response = self.client.patch('/animal/bulk/', [{'id': cat_id, 'species': 'bird'}], format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        backend = OrmBackend(registered_by=self.user)
+        records = [
+            {field: None for field in ANIMAL_FIELDS + HEALTH_FIELDS} | {
+                'species': species, 'intake_type': 'stray', 'month_of_intake': 7, 'gender': 'unknown',
+                'is_mix': False, 'age_in_years': 2, 'intake_condition': 'normal', 'neutering_status': 'unknown',
+                'source_key': f'row-{i}',
+            }
+            for i, species in enumerate(['dog', 'dog', 'cat'])
+        ]
+        backend.write(records)
+        changed = dict(records[2], species='other', intake_condition='sick')
+        backend.update([changed], [AnimalOnboarding.objects.get(source_key='row-2').pk])
+
+        self.assertEqual(read_statistics(['species'])['species'], {'bird': 1, 'dog': 3, 'other': 1})
+        self.assertStatisticsAccurate()
+
+    def test_endpoint_reads_one_row_per_bucket(self):
+        self.create_animal('dog')
+        self.create_animal('dog', intake_type='wildlife')
+        with self.assertNumQueries(1):
+            response = self.client.get('/animal/statistics/', {'dimension': 'species,intake_type'})
+        self.assertEqual(response.json(), {'species': {'dog': 2}, 'intake_type': {'stray': 1, 'wildlife': 1}})
+        self.assertEqual(self.client.get('/animal/statistics/', {'dimension': 'colour'}).status_code, 400)
+
+    def test_rebuild_fixes_drift(self):
+        self.create_animal('dog')
+        self.create_animal('cat')
+        ShelterStatistic.objects.filter(dimension='species', bucket='dog').update(count=40)
+        ShelterStatistic.objects.create(dimension='species', bucket='lizard', count=3)
+
+        out = StringIO()
+        call_command('rebuild_statistics', dry_run=True, stdout=out)
+        self.assertIn('2 BUCKETS DRIFTED', out.getvalue())
+        call_command('rebuild_statistics', stdout=out)
+        self.assertIn('FIXED 2 BUCKETS', out.getvalue())
+        self.assertStatisticsAccurate()
+        self.assertEqual(rebuild_statistics(dry_run=True), [])
+
+
+INTAKE_COLUMNS = ['record_id', 'parent_breed', 'intake_type', 'age_upon_intake_(years)', 'intake_month',
+                  'color_combination', 'animal_type', 'sex_of_animal', 'is_mix', 'intake_condition',
+                  'neutering_status']
+
+
+def intake_row(i, **values):
+    return {
+        'record_id': f'A{i}', 'parent_breed': f'Breed {i}', 'intake_type': 'Stray', 'age_upon_intake_(years)': i % 5,
+        'intake_month': i % 12 + 1, 'color_combination': 'Black', 'animal_type': ('Dog', 'Cat')[i % 2],
+        'sex_of_animal': 'Male', 'is_mix': 'Yes', 'intake_condition': 'Normal', 'neutering_status': 'Intact',
+        **values,
+    }
+
+
+class OrmIngestionTests(TestCase):
+    """
+    ingest_shelter_data end to end: 12 source rows in chunks of 4, row 9 invalid
+    """
+    backend = 'orm'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'intake.csv'
+        self.rows = [intake_row(i) for i in range(12)]
+        self.rows[9]['animal_type'] = 'Dragon'
+        self.write_source()
+
+    def write_source(self, path=None, rows=None):
+        with open(path or self.path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=INTAKE_COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.rows if rows is None else rows)
+
+    def ingest(self, path=None, **options):
+        out = StringIO()
+        call_command('ingest_shelter_data', path=str(path or self.path), batch_size=4, registered_by=self.user.id,
+                     backend=self.backend, stdout=out, **options)
+        return out.getvalue()
+
+    def rejects(self):
+        with open(f'{self.path}.rejects.csv', newline='') as f:
+            return [(row['source_row'], row['reject_reason']) for row in csv.DictReader(f)]
+
+    def test_ingests_valid_rows_and_writes_rejects(self):
+        output = self.ingest()
+        self.assertIn('CHUNK 3: 3 NEW, 0 UPDATED, 0 UNCHANGED, 1 REJECTED (12 ROWS IN TOTAL)', output)
+        self.assertEqual(AnimalOnboarding.objects.count(), 11)
+        self.assertEqual(AnimalHealth.objects.count(), 11)
+        animal = AnimalOnboarding.objects.get(breed='Breed 1')
+        self.assertEqual((animal.species, animal.intake_type, animal.gender), ('cat', 'stray', 'male'))
+        self.assertEqual(animal.current_health.neutering_status, 'intact')
+        self.assertEqual(self.rejects(), [('9', 'invalid species')])
+
+    def test_bad_cells_reject_their_row_only(self):
+        self.rows[1]['age_upon_intake_(years)'] = 'unknown'
+        self.rows[5]['intake_month'] = 'soon'
+        self.rows[6]['intake_condition'] = 'Haunted'
+        self.write_source()
+        self.assertIn('CHUNK 3: 3 NEW, 0 UPDATED, 0 UNCHANGED, 1 REJECTED (12 ROWS IN TOTAL)', self.ingest())
+        self.assertEqual(AnimalOnboarding.objects.count(), 8)
+        self.assertEqual(self.rejects(), [('1', 'invalid age_in_years'), ('5', 'invalid month_of_intake'),
+                                          ('6', 'invalid intake_condition'), ('9', 'invalid species')])
+
+    def test_rerun_is_a_noop(self):
+        self.ingest()
+        ids = list(AnimalOnboarding.objects.order_by('id').values_list('id', 'animal_id'))
+        output = self.ingest()
+        self.assertIn('CHUNK 1: 0 NEW, 0 UPDATED, 4 UNCHANGED', output)
+        self.assertIn('CHUNK 3: 0 NEW, 0 UPDATED, 3 UNCHANGED, 1 REJECTED', output)
+        self.assertEqual(list(AnimalOnboarding.objects.order_by('id').values_list('id', 'animal_id')), ids)
+        self.assertEqual(AnimalHealth.objects.count(), 11)
+
+    def test_next_file_with_an_identical_row_is_a_new_animal(self):
+        self.ingest()
+        # the next night's delta: another animal that happens to look just like row 0
+        night2 = self.path.with_name('night2.csv')
+        self.write_source(night2, [intake_row(0)])
+        self.assertIn('CHUNK 1: 1 NEW, 0 UPDATED, 0 UNCHANGED', self.ingest(night2))
+        self.assertEqual(AnimalOnboarding.objects.filter(breed='Breed 0').count(), 2)
+        self.assertIn('CHUNK 1: 0 NEW, 0 UPDATED, 1 UNCHANGED', self.ingest(night2))
+
+    def test_key_column_updates_changed_rows(self):
+        self.ingest(key_column='record_id')
+        animal = AnimalOnboarding.objects.get(source_key='A2')
+        self.rows[2]['parent_breed'] = 'Beagle'
+        self.rows[2]['neutering_status'] = 'Neutered'
+        self.write_source()
+
+        output = self.ingest(key_column='record_id')
+        self.assertIn('CHUNK 1: 0 NEW, 1 UPDATED, 3 UNCHANGED', output)
+        self.assertEqual(AnimalOnboarding.objects.count(), 11)
+        animal.refresh_from_db()
+        self.assertEqual(animal.breed, 'Beagle')
+        self.assertEqual(animal.current_health.neutering_status, 'neutered')
+
+    def test_resume_after_failed_chunk(self):
+        write_chunk = IngestionPipeline.write_chunk
+
+        def fail_third_chunk(pipeline, records, checkpoint, rows_read):
+            if rows_read > 8:
+                raise RuntimeError('connection lost')
+            return write_chunk(pipeline, records, checkpoint, rows_read)
+
+        with mock.patch.object(IngestionPipeline, 'write_chunk', fail_third_chunk):
+            with self.assertRaises(RuntimeError):
+                self.ingest()
+        self.assertEqual(AnimalOnboarding.objects.count(), 8)
+
+        output = self.ingest(resume=True)
+        self.assertNotIn('CHUNK 1', output)
+        self.assertIn('CHUNK 3: 3 NEW, 0 UPDATED, 0 UNCHANGED, 1 REJECTED', output)
+        self.assertEqual(AnimalOnboarding.objects.count(), 11)
+        # the failed chunk's reject is written once, by the run that committed it
+        self.assertEqual(self.rejects(), [('9', 'invalid species')])
+        self.assertIn('NOTHING LEFT TO INGEST', self.ingest(resume=True))
+
+    def test_profile_writes_a_report_per_chunk(self):
+        self.ingest(profile=True)
+        with open(f'{self.path}.profile.json') as f:
+            report = json.load(f)
+        self.assertEqual(report['rows'], 12)
+        self.assertEqual([chunk['number'] for chunk in report['chunks']], [1, 2, 3])
+        for chunk in report['chunks']:
+            self.assertGreater(chunk['queries'], 0)
+            self.assertGreater(chunk['rows_per_second'], 0)
+            self.assertLessEqual({'parse', 'normalize', 'fingerprint', 'lookup', 'rejects'}, set(chunk['stages']))
+        self.assertGreaterEqual(report['queries'], sum(chunk['queries'] for chunk in report['chunks']))
+        self.assertIn('checkpoint', report['stages'])
+
+
+class CopyIngestionTests(OrmIngestionTests):
+    """
+    the same, through COPY on PostgreSQL (the ORM backend elsewhere)
+    """
+    backend = 'copy'
+
+
+class AnimalIdAllocatorTests(TestCase):
+
+    def test_format_and_uniqueness_across_refills(self):
+        allocator = AnimalIdAllocator()
+        animal_ids = [animal_id for _ in range(7) for animal_id in allocator.allocate('dog', 400)]
+        self.assertEqual(len(set(animal_ids)), 2800)
+        self.assertTrue(all(re.fullmatch('DOG-[A-Z0-9]{6}', animal_id) for animal_id in animal_ids))
+        self.assertEqual(allocator.allocate_many(['cat', 'bird', 'cat'])[1][:4], 'BIR-')
+
+    def test_skips_ids_taken_by_the_old_generator(self):
+        AnimalOnboarding.objects.create(species='dog', animal_id=f'DOG-{encode(5 * BLOCK_SIZE)}',
+                                        registered_by=create_user())
+        with mock.patch('core.animal_ids.reserve_blocks', return_value=[5]):
+            self.assertEqual(AnimalIdAllocator().allocate('dog', 2),
+                             [f'DOG-{encode(5 * BLOCK_SIZE + 1)}', f'DOG-{encode(5 * BLOCK_SIZE + 2)}'])
+
+    def test_rolled_back_reservations_are_not_handed_out_again(self):
+        allocator, other_worker = AnimalIdAllocator(), AnimalIdAllocator()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            allocator.allocate('dog', 5)
+            raise RuntimeError
+        # without sequences the block counter went back too, so the block is reserved
+        # again: by either worker, but never by both
+        animal_ids = allocator.allocate('dog', 1200) + other_worker.allocate('dog', 1200)
+        self.assertEqual(len(set(animal_ids)), 2400)
+
+    @skipUnless(connection.vendor == 'postgresql', 'threads need their own connections to the test database')
+    def test_threads_never_share_ids(self):
+        allocator = AnimalIdAllocator()
+        allocated = []
+
+        def allocate():
+            try:
+                for _ in range(5):
+                    allocated.extend(allocator.allocate('cat', 300))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(allocated)), 6000)
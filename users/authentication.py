@@ -0,0 +1,232 @@
+"""
+    description: Expiring token authentication without a database round trip per request.
+
+    Token -> user lookups are kept in a bounded in-process LRU with a short TTL and,
+    when settings.TOKEN_AUTH_CACHE['SHARED_ALIAS'] names a cache (e.g. Redis), in a
+    shared tier with a longer TTL that all workers fill for each other. Logout,
+    deleting a Token and saving its user (e.g. a password change) evict the
+    entry here and in the shared tier; other workers' in-process copies expire
+    within LOCAL_TTL seconds.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'LOCAL_TTL': 30,
+    'SHARED_ALIAS': None,
+    'SHARED_TTL': 300,
+}
+
+EXPIRY_DEFAULTS = {
+    'TTL': timedelta(days=7),
+    'RENEW_AFTER': timedelta(hours=1),
+    'ROTATE_ON_LOGIN': False,
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+
+def cache_key(token_key):
+    # tokens are credentials: only a digest of them is ever stored
+    return 'auth:token:' + hashlib.sha256(token_key.encode()).hexdigest()
+
+
+class TokenUserCache:
+    """
+        description: token -> (user, token created) LRU with per entry expiry, thread
+                     safe, plus the optional shared tier and hit/miss counters
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    @property
+    def shared(self):
+        alias = get_options()['SHARED_ALIAS']
+        return caches[alias] if alias else None
+
+    def get(self, token_key):
+        """
+        (user, created) or None; the user is a copy the caller may modify
+        """
+        key = cache_key(token_key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, (user, created) = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.counters['local_hits'] += 1
+                    # every request gets its own copy to modify
+                    return copy.copy(user), created
+                del self._entries[key]
+
+        shared = self.shared
+        value = shared.get(key) if shared is not None else None
+        if value is None:
+            self._count('misses')
+            return None
+        self._count('shared_hits')
+        self._store_local(key, value)
+        return copy.copy(value[0]), value[1]
+
+    def _store_local(self, key, value):
+        options = get_options()
+        user, created = value
+        with self._lock:
+            self._entries[key] = (time.monotonic() + options['LOCAL_TTL'], (copy.copy(user), created))
+            self._entries.move_to_end(key)
+            while len(self._entries) > options['MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def set(self, token_key, user, created):
+        key = cache_key(token_key)
+        self._store_local(key, (user, created))
+        shared = self.shared
+        if shared is not None:
+            shared.set(key, (user, created), timeout=get_options()['SHARED_TTL'])
+
+    def invalidate(self, *token_keys):
+        keys = [cache_key(token_key) for token_key in token_keys]
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            self.counters['invalidations'] += len(keys)
+        shared = self.shared
+        if shared is not None and keys:
+            shared.delete_many(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        lookups = counters['local_hits'] + counters['shared_hits'] + counters['misses']
+        return {
+            **counters,
+            'hit_ratio': (counters['local_hits'] + counters['shared_hits']) / lookups if lookups else None,
+            'size': size,
+            'max_entries': get_options()['MAX_ENTRIES'],
+            'shared_tier': get_options()['SHARED_ALIAS'],
+        }
+
+
+token_cache = TokenUserCache()
+
+
+def token_expiry():
+    return {**EXPIRY_DEFAULTS, **getattr(settings, 'TOKEN_EXPIRY', {})}
+
+
+def is_expired(created, now=None):
+    ttl = token_expiry()['TTL']
+    return ttl is not None and created + ttl <= (now or timezone.now())
+
+
+def issue_token(user, rotate=None):
+    """
+    the user's token for a login/signup: an expired token is always replaced, a valid
+    one only when rotating (TOKEN_EXPIRY['ROTATE_ON_LOGIN'] unless `rotate` says otherwise)
+    """
+    if rotate is None:
+        rotate = token_expiry()['ROTATE_ON_LOGIN']
+    try:
+        # no query when the user was loaded with select_related('auth_token')
+        token = user.auth_token
+    except Token.DoesNotExist:
+        token = None
+    if token is not None and (rotate or is_expired(token.created)):
+        token.delete()
+        token = None
+    if token is None:
+        token = Token.objects.create(user=user)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+        description: TokenAuthentication that answers from token_cache and only queries
+                     Token + user on a miss. Tokens expire TOKEN_EXPIRY['TTL'] after
+                     they were created or last renewed; a token in use is renewed (one
+                     UPDATE) once it is older than RENEW_AFTER, so active clients never
+                     see it expire.
+    """
+
+    def authenticate_credentials(self, key):
+        now = timezone.now()
+        cached = token_cache.get(key)
+        if cached is not None and is_expired(cached[1], now):
+            # another worker may have renewed it since: only the database can tell
+            token_cache.invalidate(key)
+            cached = None
+
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            if is_expired(token.created, now):
+                token.delete()
+                raise exceptions.AuthenticationFailed('Token has expired.')
+            created = token.created
+        else:
+            user, created = cached
+            if not user.is_active:
+                token_cache.invalidate(key)
+                raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        renew_after = token_expiry()['RENEW_AFTER']
+        if renew_after is not None and created + renew_after <= now:
+            if not self.get_model().objects.filter(key=key).update(created=now):
+                # deleted since it was cached (logout or the purge on another worker)
+                token_cache.invalidate(key)
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            created = now
+            token_cache.set(key, user, created)
+        elif cached is None:
+            token_cache.set(key, user, created)
+        # request.auth only needs the key; the Token row itself is not reloaded
+        return user, self.get_model()(key=key, user=user, created=created)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    a saved user may have a new password or lost staff rights: their cached tokens go
+    """
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    token_cache.invalidate(*Token.objects.filter(user=instance).values_list('key', flat=True))
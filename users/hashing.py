@@ -0,0 +1,113 @@
+"""
+    description: Password hashing off the request path: a process pool for bulk imports,
+                 and a bounded thread pool (password_pool) for logins and signups
+
+    Kept free of model imports: spawned workers unpickle `_init_worker` from this
+    module before django.setup() has run in them.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+
+# below this many passwords starting worker processes costs more than it saves
+POOL_THRESHOLD = 8
+
+DEFAULTS = {
+    # threads hashing at once; None is one per CPU
+    'WORKERS': None,
+    # hashes running or queued before new logins are turned away
+    'MAX_PENDING': 64,
+}
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    make_password for every entry, across `workers` processes (default: one per CPU)
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < POOL_THRESHOLD:
+        return [make_password(password) for password in passwords]
+    # spawned, not forked: a forked child would share the parent's database sockets
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'animalshelterproject.settings'),),
+    ) as pool:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+class HashingBusy(Exception):
+    """
+        description: Raised instead of queueing when MAX_PENDING hashes are already waiting
+    """
+
+
+class PasswordHashingPool:
+    """
+        description: Bounded thread pool for check_password / make_password. PBKDF2 runs
+                     in OpenSSL with the GIL released, so threads hash in parallel while
+                     the event loop (or a sync worker) stays free; past MAX_PENDING
+                     submissions fail fast with HashingBusy rather than queue up
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                options = {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHING', {})}
+                self._slots = threading.BoundedSemaphore(options['MAX_PENDING'])
+                self._executor = ThreadPoolExecutor(
+                    max_workers=options['WORKERS'] or os.cpu_count() or 1,
+                    thread_name_prefix='password-hashing',
+                )
+        return self._executor
+
+    def submit(self, function, *args):
+        executor = self._start()
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, function, *args):
+        """
+        `function(*args)` on a pool thread; the calling thread waits for it
+        """
+        return self.submit(function, *args).result()
+
+    async def arun(self, function, *args):
+        """
+        awaitable `function(*args)` on a pool thread
+        """
+        return await asyncio.wrap_future(self.submit(function, *args))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+password_pool = PasswordHashingPool()
@@ -0,0 +1,135 @@
+"""
+    description: Bulk onboarding of users (staff, volunteers, ...) from CSV or JSON
+
+    Rows are validated without a query per row, passwords are hashed across a process
+    pool (a password hash is deliberately slow and CPU bound), and users and their
+    tokens are inserted with one bulk_create each per batch. Rows whose email is
+    already registered (also by a signup racing the import), or repeated in the file,
+    are reported and skipped.
+"""
+import csv
+import io
+import json
+
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+
+from core.models import ShelterUser
+
+from .hashing import hash_passwords
+
+
+FORMATS = ('csv', 'json')
+BATCH_SIZE = 500
+
+
+class UserImportSerializer(serializers.ModelSerializer):
+    """
+        description: One imported user; email uniqueness is checked for the whole batch
+                     at once by import_users, not per row
+    """
+
+    class Meta:
+        model = ShelterUser
+        fields = ['email', 'password', 'name', 'usertype', 'phone_number', 'location', 'is_staff']
+        extra_kwargs = {'email': {'validators': []}}
+
+    def validate_email(self, value):
+        return ShelterUser.objects.normalize_email(value)
+
+
+def read_users(source, file_format):
+    """
+    rows (dicts) from a CSV or JSON file object or string
+    """
+    if isinstance(source, bytes):
+        source = source.decode('utf-8-sig')
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    if file_format == 'csv':
+        return list(csv.DictReader(source))
+    if file_format == 'json':
+        rows = json.load(source)
+        if not isinstance(rows, list):
+            raise ValueError('a JSON import must be a list of users')
+        return rows
+    raise ValueError(f'unknown import format {file_format!r}')
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.created = []
+        self.duplicates = []
+        self.errors = []
+
+    def as_dict(self):
+        return {
+            'created': len(self.created),
+            'emails': self.created,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+        }
+
+
+def drop_registered(batch, result):
+    """
+    reports the (row number, data) pairs whose email is already registered as
+    duplicates, with one query, and returns the rest
+    """
+    registered = set(ShelterUser.objects.filter(email__in=[data['email'] for _, data in batch])
+                     .values_list('email', flat=True))
+    for number, data in batch:
+        if data['email'] in registered:
+            result.duplicates.append({'row': number, 'email': data['email'], 'reason': 'already registered'})
+    return [(number, data) for number, data in batch if data['email'] not in registered]
+
+
+def import_users(rows, workers=None, batch_size=BATCH_SIZE):
+    """
+    validates, hashes and inserts `rows`; returns an ImportResult. Row numbers in the
+    report start at 1
+    """
+    result = ImportResult()
+    valid = []
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        serializer = UserImportSerializer(data=row)
+        if not serializer.is_valid():
+            result.errors.append({'row': number, 'errors': serializer.errors})
+            continue
+        email = serializer.validated_data['email']
+        if email in seen:
+            result.duplicates.append({'row': number, 'email': email, 'reason': 'repeated in this import'})
+            continue
+        seen.add(email)
+        valid.append((number, serializer.validated_data))
+
+    for start in range(0, len(valid), batch_size):
+        batch = drop_registered(valid[start:start + batch_size], result)
+        if not batch:
+            continue
+
+        hashes = dict(zip([number for number, _ in batch],
+                          hash_passwords([data['password'] for _, data in batch], workers=workers)))
+        while batch:
+            users = [ShelterUser(**{**data, 'password': hashes[number]}) for number, data in batch]
+            try:
+                with transaction.atomic():
+                    ShelterUser.objects.bulk_create(users)
+                    # what the create_auth_token post_save handler does for single signups
+                    Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+            except IntegrityError:
+                # someone signed up with one of these emails since the check above: they
+                # become duplicates and the rest of the batch is inserted again
+                remaining = drop_registered(batch, result)
+                if len(remaining) == len(batch):
+                    raise
+                batch = remaining
+                continue
+            result.created.extend(user.email for user in users)
+            break
+
+    result.duplicates.sort(key=lambda duplicate: duplicate['row'])
+    return result
@@ -0,0 +1,87 @@
+"""
+    description: Email + password login and signup with the password hashing done on
+                 password_pool, shared by the DRF views and their async (ASGI) twins
+
+    The user and their token come back in one query (select_related('auth_token')),
+    and the request thread or event loop only waits for the hash, it never computes it.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password, verify_password
+
+from core.models import ShelterUser
+from .authentication import issue_token
+from .hashing import password_pool
+from .serializers import SignupSerializer
+
+
+def login_queryset():
+    return ShelterUser.objects.select_related('auth_token')
+
+
+def check_credentials(user, password):
+    """
+    (valid, must_update) for `password`; runs on password_pool. An unknown email costs
+    one hash as well, as in ModelBackend, so timings do not tell which emails exist
+    """
+    if user is None:
+        make_password(password)
+        return False, False
+    return verify_password(password, user.password)
+
+
+def login(email, password):
+    """
+    the user's token, or None for bad credentials; raises HashingBusy when the pool is full
+    """
+    try:
+        user = login_queryset().get(email=email)
+    except ShelterUser.DoesNotExist:
+        user = None
+    valid, must_update = password_pool.run(check_credentials, user, password)
+    if not valid:
+        return None
+    if must_update:
+        # stored with an outdated hasher or iteration count: upgrade it, as set_password would
+        user.password = password_pool.run(make_password, password)
+        user.save(update_fields=['password'])
+    return issue_token(user)
+
+
+async def alogin(email, password):
+    """
+    async login(): the query, the hash and the token never block the event loop
+    """
+    try:
+        user = await login_queryset().aget(email=email)
+    except ShelterUser.DoesNotExist:
+        user = None
+    valid, must_update = await password_pool.arun(check_credentials, user, password)
+    if not valid:
+        return None
+    if must_update:
+        user.password = await password_pool.arun(make_password, password)
+        await user.asave(update_fields=['password'])
+    return await sync_to_async(issue_token)(user)
+
+
+def create_user(data, password_hash):
+    user = ShelterUser(**data)
+    user.password = password_hash
+    # post_save creates the token, issue_token hands it back without another query
+    user.save()
+    return issue_token(user, rotate=False)
+
+
+async def asignup(data):
+    """
+    validates signup `data` and creates the user, returning their token; raises
+    ValidationError, or HashingBusy when the pool is full
+    """
+    if isinstance(data.get('email'), str):
+        # normalized before the unique check, or Foo@BAR.org slips past foo@bar.org
+        data = {**data, 'email': ShelterUser.objects.normalize_email(data['email'])}
+    serializer = SignupSerializer(data=data)
+    await sync_to_async(serializer.is_valid)(raise_exception=True)
+    validated = dict(serializer.validated_data)
+    password_hash = await password_pool.arun(make_password, validated.pop('password', None))
+    return await sync_to_async(create_user)(validated, password_hash)
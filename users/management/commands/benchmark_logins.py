@@ -0,0 +1,91 @@
+import asyncio
+import math
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+
+from core.models import ShelterUser
+from users.hashing import password_pool
+
+
+EMAIL_DOMAIN = 'benchmark.invalid'
+PASSWORD = 'benchmark-password'
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)] if ordered else 0.0
+
+
+class Command(BaseCommand):
+    help = ("Measuring logins/second and p99 latency of /user/login/ (sync) against /user/login/async/, "
+            "with /animal/list/ requests running at the same time, through the ASGI handler")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help='Logins per path')
+        parser.add_argument('--concurrency', type=int, default=50, help='Logins in flight at once')
+        parser.add_argument('--animal-requests', type=int, default=100,
+                            help='/animal/list/ requests issued alongside the logins')
+        parser.add_argument('--users', type=int, default=50,
+                            help='Users to log in as; created for the run and deleted afterwards')
+
+    def handle(self, *args, **options):
+        if min(options['logins'], options['concurrency'], options['animal_requests'], options['users']) < 1:
+            raise CommandError('--logins, --concurrency, --animal-requests and --users must be positive integers')
+
+        # one hash for every user: verifying it costs the same as verifying distinct ones
+        password = make_password(PASSWORD)
+        users = ShelterUser.objects.bulk_create(
+            ShelterUser(email=f'login{i}@{EMAIL_DOMAIN}', password=password, name='benchmark',
+                        phone_number='0000000000', location='benchmark')
+            for i in range(options['users'])
+        )
+        try:
+            self.stdout.write(f'{"path":<20}{"logins/s":>10}{"login p99 ms":>14}{"503s":>6}{"animal p99 ms":>15}')
+            for path in ('/user/login/', '/user/login/async/'):
+                result = asyncio.run(self.run(path, users, options))
+                self.stdout.write(
+                    f"{path:<20}{result['rate']:>10.1f}{result['login_p99'] * 1000:>14.1f}"
+                    f"{result['busy']:>6}{result['animal_p99'] * 1000:>15.1f}"
+                )
+        finally:
+            ShelterUser.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+            password_pool.shutdown()
+
+    async def run(self, path, users, options):
+        client = AsyncClient()
+        login_slots = asyncio.Semaphore(options['concurrency'])
+        # a few readers browsing the listing while everybody logs in
+        animal_slots = asyncio.Semaphore(4)
+        login_timings, animal_timings = [], []
+        busy = 0
+
+        async def timed(slots, timings, request):
+            nonlocal busy
+            async with slots:
+                started = time.perf_counter()
+                response = await request()
+                timings.append(time.perf_counter() - started)
+                busy += response.status_code == 503
+
+        def login(user):
+            return lambda: client.post(path, {'email': user.email, 'password': PASSWORD},
+                                       content_type='application/json')
+
+        def animals():
+            return client.get('/animal/list/?page_size=20')
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(timed(login_slots, login_timings, login(users[i % len(users)])) for i in range(options['logins'])),
+            *(timed(animal_slots, animal_timings, animals) for _ in range(options['animal_requests'])),
+        )
+        elapsed = time.perf_counter() - started
+        return {
+            'rate': len(login_timings) / elapsed,
+            'login_p99': percentile(login_timings, 0.99),
+            'animal_p99': percentile(animal_timings, 0.99),
+            'busy': busy,
+        }
@@ -0,0 +1,50 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from users.imports import BATCH_SIZE, FORMATS, import_users, read_users
+
+
+class Command(BaseCommand):
+    help = "Importing users (staff, volunteers, ...) from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or JSON list of users')
+        parser.add_argument('--format', dest='file_format', choices=FORMATS, default=None,
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes hashing passwords (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Users hashed and inserted per transaction')
+        parser.add_argument('--report', default=None,
+                            help='Write duplicates and invalid rows to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive integer')
+        file_format = options['file_format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError('cannot tell the file format, pass --format')
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                rows = read_users(f, file_format)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"cannot read {options['path']}: {exc}")
+
+        result = import_users(rows, workers=options['workers'], batch_size=options['batch_size'])
+
+        for duplicate in result.duplicates:
+            self.stdout.write(self.style.WARNING(
+                f"ROW {duplicate['row']}: {duplicate['email']} SKIPPED, {duplicate['reason']}"
+            ))
+        for error in result.errors:
+            self.stdout.write(self.style.ERROR(f"ROW {error['row']}: {json.dumps(error['errors'])}"))
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump({'duplicates': result.duplicates, 'errors': result.errors}, f, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'IMPORTED {len(result.created)} USERS, {len(result.duplicates)} DUPLICATES, '
+            f'{len(result.errors)} INVALID ROWS'
+        ))
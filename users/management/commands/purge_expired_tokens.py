@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from users.authentication import token_cache, token_expiry
+
+
+class Command(BaseCommand):
+    help = "Deleting expired auth tokens in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Tokens deleted per transaction; small batches keep row locks short')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between batches')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the expired tokens')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive integer')
+        ttl = token_expiry()['TTL']
+        if ttl is None:
+            raise CommandError('TOKEN_EXPIRY has no TTL: tokens never expire')
+
+        cutoff = timezone.now() - ttl
+        expired = Token.objects.filter(created__lte=cutoff)
+        if options['dry_run']:
+            self.stdout.write(f'{expired.count()} EXPIRED TOKENS')
+            return
+
+        table, key, created = map(connection.ops.quote_name, (Token._meta.db_table, 'key', 'created'))
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                # walks authtoken_token_created_idx; a token renewed meanwhile is kept
+                # by the second check on created
+                keys = list(expired.order_by('created').values_list('key', flat=True)[:options['batch_size']])
+                if not keys:
+                    break
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'DELETE FROM {table} WHERE {key} IN ({", ".join(["%s"] * len(keys))}) AND {created} <= %s',
+                        [*keys, cutoff],
+                    )
+                    deleted += cursor.rowcount
+            # the raw DELETE sends no post_delete, so cached entries are dropped here
+            token_cache.invalidate(*keys)
+            self.stdout.write(f'DELETED {deleted} TOKENS SO FAR')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'PURGED {deleted} EXPIRED TOKENS'))
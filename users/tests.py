@@ -1,3 +1,273 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import ShelterUser
+from core.tests import create_user
+from users.authentication import token_cache
+from users.hashing import HashingBusy, password_pool
+from users.imports import import_users
 
 # Create your tests here.
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=True)
+        cls.token = Token.objects.get(user=cls.user)
+
+    def setUp(self):
+        token_cache.clear()
+        token_cache.reset_stats()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get(self):
+        return self.client.get('/user/token-cache-stats/')
+
+    def test_second_request_skips_the_database(self):
+        self.assertEqual(self.get().status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['local_hits'], 1)
+        self.assertEqual(response.json()['misses'], 1)
+
+    def test_deleting_the_token_invalidates(self):
+        self.get()
+        Token.objects.filter(user=self.user).delete()
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_password_change_invalidates(self):
+        self.get()
+        self.user.set_password('changed')
+        self.user.save()
+        # back to the Token + user query
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_deleting_the_user_invalidates(self):
+        self.get()
+        self.user.delete()
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_logout_invalidates(self):
+        self.get()
+        self.client.get('/user/logout/')
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+    def test_unknown_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token nope')
+        self.assertEqual(self.get().status_code, 401)
+
+    @override_settings(TOKEN_AUTH_CACHE={'SHARED_ALIAS': 'default', 'MAX_ENTRIES': 1})
+    def test_shared_tier(self):
+        cache.clear()
+        self.get()
+        token_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(token_cache.stats()['shared_hits'], 1)
+
+        Token.objects.filter(user=self.user).delete()
+        token_cache.clear()
+        self.assertEqual(self.get().status_code, 401)
+
+
+@override_settings(TOKEN_EXPIRY={'TTL': timedelta(days=7), 'RENEW_AFTER': timedelta(hours=1)})
+class TokenExpiryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=True)
+
+    def setUp(self):
+        token_cache.clear()
+        self.client = APIClient()
+
+    def age_token(self, **delta):
+        Token.objects.filter(user=self.user).update(created=timezone.now() - timedelta(**delta))
+        return Token.objects.get(user=self.user)
+
+    def authenticate(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return self.client.get('/user/token-cache-stats/')
+
+    def test_expired_token_is_rejected_and_deleted(self):
+        token = self.age_token(days=8)
+        self.assertEqual(self.authenticate(token).status_code, 401)
+        self.assertFalse(Token.objects.filter(key=token.key).exists())
+
+    def test_token_in_use_is_renewed(self):
+        token = self.age_token(days=6, hours=23)
+        self.assertEqual(self.authenticate(token).status_code, 200)
+        renewed = Token.objects.get(key=token.key).created
+        self.assertGreater(renewed, timezone.now() - timedelta(minutes=1))
+        # fresh enough: served from the cache without another UPDATE
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token).status_code, 200)
+
+    def test_token_deleted_elsewhere_is_not_renewed(self):
+        token = Token.objects.get(user=self.user)
+        # cached here and due for renewal, then deleted by another worker, whose
+        # invalidation never reaches this process's cache
+        token_cache.set(token.key, self.user, timezone.now() - timedelta(hours=2))
+        with mock.patch.object(token_cache, 'invalidate'):
+            Token.objects.filter(key=token.key).delete()
+        self.assertEqual(self.authenticate(token).status_code, 401)
+        self.assertIsNone(token_cache.get(token.key))
+
+    def test_login_replaces_expired_token_and_can_rotate(self):
+        old = self.age_token(days=8)
+        response = self.client.post('/user/login/', {'email': 'staff@shelter.org', 'password': 'password'})
+        new = response.json()['token']
+        self.assertNotEqual(new, old.key)
+
+        response = self.client.post('/user/login/', {'email': 'staff@shelter.org', 'password': 'password'})
+        self.assertEqual(response.json()['token'], new)
+        with self.settings(TOKEN_EXPIRY={'ROTATE_ON_LOGIN': True}):
+            response = self.client.post('/user/login/', {'email': 'staff@shelter.org', 'password': 'password'})
+        self.assertNotEqual(response.json()['token'], new)
+        self.assertEqual(Token.objects.filter(user=self.user).count(), 1)
+
+    def test_logout_deletes_the_token(self):
+        token = Token.objects.get(user=self.user)
+        self.authenticate(token)
+        self.client.get('/user/logout/')
+        self.assertFalse(Token.objects.filter(key=token.key).exists())
+        self.assertEqual(self.authenticate(token).status_code, 401)
+
+    def test_purge_command(self):
+        users = [
+            create_user(f'user{i}@shelter.org', name='user')
+            for i in range(5)
+        ]
+        stale = Token.objects.get(user=users[0])
+        # cached while still valid (not staff, hence 403); the purge has to evict it
+        self.assertEqual(self.authenticate(stale).status_code, 403)
+        Token.objects.filter(user__in=users[:3]).update(created=timezone.now() - timedelta(days=30))
+        call_command('purge_expired_tokens', batch_size=2, stdout=StringIO())
+        self.assertEqual(Token.objects.count(), 3)
+        self.assertEqual(token_cache.stats()['size'], 0)
+        self.assertEqual(self.authenticate(stale).status_code, 401)
+
+
+class UserImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin@shelter.org', name='admin', is_staff=True)
+
+    def volunteers(self, count):
+        return [
+            {'email': f'volunteer{i}@partner.org', 'password': f'secret-{i}', 'name': f'volunteer {i}',
+             'usertype': 'volunteer', 'phone_number': '9876543210', 'location': 'Mumbai'}
+            for i in range(count)
+        ]
+
+    def test_import_hashes_in_a_process_pool_and_creates_tokens(self):
+        rows = self.volunteers(10) + [{'email': 'admin@shelter.org', 'password': 'x', 'name': 'again',
+                                        'phone_number': '1', 'location': 'Pune'},
+                                       {**self.volunteers(1)[0], 'name': 'repeated'},
+                                       {'email': 'not-an-email', 'password': 'x'}]
+        result = import_users(rows, workers=2)
+        self.assertEqual(len(result.created), 10)
+        self.assertEqual([(duplicate['row'], duplicate['reason']) for duplicate in result.duplicates],
+                         [(11, 'already registered'), (12, 'repeated in this import')])
+        self.assertEqual([error['row'] for error in result.errors], [13])
+
+        user = ShelterUser.objects.get(email='volunteer3@partner.org')
+        self.assertTrue(user.check_password('secret-3'))
+        self.assertEqual(user.usertype, 'volunteer')
+        self.assertEqual(Token.objects.filter(user__email__endswith='@partner.org').count(), 10)
+
+    def test_signup_racing_the_import_becomes_a_duplicate(self):
+        def sign_up_while_hashing(passwords, workers=None):
+            create_user('volunteer1@partner.org', name='early bird')
+            return [f'hash-{i}' for i, _ in enumerate(passwords)]
+
+        with mock.patch('users.imports.hash_passwords', sign_up_while_hashing):
+            result = import_users(self.volunteers(3))
+        self.assertEqual(result.created, ['volunteer0@partner.org', 'volunteer2@partner.org'])
+        self.assertEqual(result.duplicates,
+                         [{'row': 2, 'email': 'volunteer1@partner.org', 'reason': 'already registered'}])
+        self.assertEqual(ShelterUser.objects.get(email='volunteer1@partner.org').name, 'early bird')
+
+    def test_import_endpoint_accepts_csv_upload(self):
+        rows = self.volunteers(3)
+        content = ','.join(rows[0]) + '\n' + '\n'.join(','.join(row.values()) for row in rows)
+        upload = SimpleUploadedFile('volunteers.csv', content.encode(), content_type='text/csv')
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/user/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['created'], 3)
+
+        response = client.post('/user/import/', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['duplicates']), 3)
+
+    def test_import_command(self):
+        path = Path(tempfile.mkdtemp()) / 'volunteers.json'
+        path.write_text(json.dumps(self.volunteers(2)))
+        out = StringIO()
+        call_command('import_users', str(path), stdout=out)
+        self.assertIn('IMPORTED 2 USERS', out.getvalue())
+
+
+class LoginTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+
+    def login(self, path, password='password', email='staff@shelter.org'):
+        return self.client.post(path, {'email': email, 'password': password}, content_type='application/json')
+
+    def test_user_and_token_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.login('/user/login/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['token'], Token.objects.get(user=self.user).key)
+
+    def test_async_login(self):
+        response = self.login('/user/login/async/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['token'], Token.objects.get(user=self.user).key)
+        self.assertEqual(self.login('/user/login/async/', password='wrong').status_code, 401)
+        self.assertEqual(self.login('/user/login/async/', email='nobody@shelter.org').status_code, 401)
+        self.assertEqual(self.client.post('/user/login/async/', '[', content_type='application/json').status_code,
+                         400)
+
+    def test_full_pool_answers_503(self):
+        with mock.patch.object(password_pool, 'submit', side_effect=HashingBusy):
+            for path in ('/user/login/', '/user/login/async/'):
+                response = self.login(path)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '1')
+
+    def test_async_signup(self):
+        data = {'email': 'Volunteer@Partner.org', 'password': 'secret', 'name': 'volunteer', 'usertype': 'volunteer',
+                'phone_number': '9876543210', 'location': 'Mumbai'}
+        response = self.client.post('/user/signup/async/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        user = ShelterUser.objects.get(email='Volunteer@partner.org')
+        self.assertTrue(user.check_password('secret'))
+        self.assertEqual(response.json()['token'], Token.objects.get(user=user).key)
+
+        response = self.client.post('/user/signup/async/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json())
@@ -1,8 +1,14 @@
 from django.urls import path
-from users.views import SignupView, LoginView, LogoutView
+from users.views import (
+    SignupView, LoginView, LogoutView, TokenCacheStatsView, UserImportView, AsyncSignupView, AsyncLoginView
+)
 
 urlpatterns = [
     path('signup/', SignupView.as_view(), name='sign-up'),
     path('login/', LoginView.as_view(), name='log-in'),
-    path('logout/', LogoutView.as_view(), name='log-out')
+    path('signup/async/', AsyncSignupView.as_view(), name='sign-up-async'),
+    path('login/async/', AsyncLoginView.as_view(), name='log-in-async'),
+    path('logout/', LogoutView.as_view(), name='log-out'),
+    path('import/', UserImportView.as_view(), name='user-import'),
+    path('token-cache-stats/', TokenCacheStatsView.as_view(), name='token-cache-stats'),
 ]
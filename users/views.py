@@ -1,10 +1,18 @@
+import functools
+import json
+
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (
     ListAPIView, 
     ListCreateAPIView,
@@ -12,11 +20,17 @@ from rest_framework.generics import (
     DestroyAPIView
 )
 from django.contrib.auth import logout
+from .authentication import CachedTokenAuthentication, issue_token, token_cache
+from .hashing import HashingBusy
+from .imports import FORMATS, import_users, read_users
+from .login import alogin, asignup, login
 from .serializers import SignupSerializer, LoginSerializer
 from core.models import ShelterUser
 
 # Create your views here.
 
+BUSY = {'error': 'Too many logins in progress, retry shortly.'}
+
 
 class SignupView(CreateAPIView):
     permission_classes = [AllowAny]
@@ -26,12 +40,7 @@ class SignupView(CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
-
-        token = None
-        try:
-            token = Token.objects.get(user=user)
-        except:
-            token = Token.objects.create(user=user)
+        token = issue_token(user, rotate=False)
 
         return Response({'token': token.key}, status=status.HTTP_200_OK)
 
@@ -44,22 +53,116 @@ class LoginView(CreateAPIView):
         email = request.data.get('email')
         password = request.data.get('password')
 
-        user = ShelterUser.objects.filter(email=email).first()
-        # print("USER_OBJ_HERE:", user.email, user.password)
-        if user and user.check_password(password):
-            token = None
-            try:
-                token = Token.objects.get(user=user)
-            except:
-                token = Token.objects.create(user=user)
+        try:
+            token = login(email, password)
+        except HashingBusy:
+            return Response(BUSY, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+        if token is not None:
             return Response({'message':'Logged in successfully.', 'token': token.key}, status=status.HTTP_200_OK)
         else:
             return Response({'error':'Invalid credentials.'}, status=status.HTTP_401_UNAUTHORIZED)
 
+
+def auth_errors(post):
+    """
+    an async post() with ValidationError answered as 400 and HashingBusy as 503 + Retry-After
+    """
+    @functools.wraps(post)
+    async def wrapper(self, request, *args, **kwargs):
+        try:
+            return await post(self, request, *args, **kwargs)
+        except ValidationError as exc:
+            return JsonResponse(exc.detail, status=status.HTTP_400_BAD_REQUEST)
+        except HashingBusy:
+            response = JsonResponse(BUSY, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response.headers['Retry-After'] = '1'
+            return response
+    return wrapper
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAuthView(View):
+    """
+        description: Base for the async (ASGI) login and signup: a JSON or form body in,
+                     JSON out; subclasses wrap their post() in auth_errors
+    """
+
+    def get_data(self, request):
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                raise ValidationError({'detail': 'JSON parse error.'})
+            if not isinstance(data, dict):
+                raise ValidationError({'detail': 'Expected a JSON object.'})
+            return data
+        return request.POST.dict()
+
+
+class AsyncLoginView(AsyncAuthView):
+
+    @auth_errors
+    async def post(self, request, *args, **kwargs):
+        data = self.get_data(request)
+        token = await alogin(data.get('email'), data.get('password'))
+        if token is None:
+            return JsonResponse({'error':'Invalid credentials.'}, status=status.HTTP_401_UNAUTHORIZED)
+        return JsonResponse({'message':'Logged in successfully.', 'token': token.key}, status=status.HTTP_200_OK)
+
+
+class AsyncSignupView(AsyncAuthView):
+
+    @auth_errors
+    async def post(self, request, *args, **kwargs):
+        token = await asignup(self.get_data(request))
+        return JsonResponse({'token': token.key}, status=status.HTTP_200_OK)
+
+
 class LogoutView(APIView):
     permission_classes = [AllowAny]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def get(self, request):
+        if request.auth is not None:
+            # post_delete drops the cached entry as well
+            Token.objects.filter(key=request.auth.key).delete()
         logout(request)
-        return Response({"message":"Logged out successfully."}, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({"message":"Logged out successfully."}, status=status.HTTP_200_OK)
+
+
+class TokenCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(token_cache.stats(), status=status.HTTP_200_OK)
+
+
+class UserImportView(APIView):
+    """
+        description: Bulk user onboarding. POST a JSON list of users, or upload a .csv /
+                     .json file as "file"; duplicates by email are reported, not fatal
+    """
+    permission_classes = [IsAdminUser]
+    max_users = 5000
+
+    def get_rows(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            if not isinstance(request.data, list):
+                raise ValidationError({'file': ['Upload a file or send a JSON list of users.']})
+            return request.data
+
+        file_format = upload.name.rsplit('.', 1)[-1].lower()
+        if file_format not in FORMATS:
+            raise ValidationError({'file': [f'Must be one of: {", ".join(FORMATS)}.']})
+        try:
+            return read_users(upload.read(), file_format)
+        except (UnicodeDecodeError, ValueError) as exc:
+            raise ValidationError({'file': [str(exc)]})
+
+    def post(self, request):
+        rows = self.get_rows(request)
+        if len(rows) > self.max_users:
+            raise ValidationError({'file': [f'At most {self.max_users} users per import.']})
+        result = import_users(rows)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)